@@ -0,0 +1,130 @@
+# bridal_api/cache.py
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+from rest_framework import serializers
+from rest_framework.response import Response
+
+
+def get_cache():
+    return caches[getattr(settings, "CATALOG_CACHE_ALIAS", "catalog")]
+
+
+# -------------------- VERSIONS --------------------
+# Every model has a version token in the cache. Cached responses are keyed on
+# the versions of all models they render, so bumping a version makes every
+# dependent entry unreachable without having to find and delete it.
+def _version_key(label):
+    return f"catalog:version:{label}"
+
+
+def get_versions(labels):
+    """Return {label: version}, creating versions that are missing or were evicted."""
+    cache = get_cache()
+    keys = {_version_key(label): label for label in labels}
+    found = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return {label: found[key] for key, label in keys.items()}
+
+
+def _bump(labels):
+    get_cache().set_many({_version_key(label): time.time_ns() for label in labels}, timeout=None)
+
+
+def invalidate(*models):
+    """
+    Bump the version of each model now and again once the surrounding
+    transaction commits, so a response cached from pre-commit data in
+    between is discarded as well.
+    """
+    labels = [model._meta.label_lower for model in models]
+    _bump(labels)
+    transaction.on_commit(lambda: _bump(labels))
+
+
+def dependencies(serializer, model):
+    """
+    Labels of every model a serializer can render, following nested
+    serializers and every relation it could be asked to ?expand=.
+    """
+    labels = {model._meta.label_lower}
+    nested = []
+    for field in serializer.fields.values():
+        if isinstance(field, serializers.ListSerializer):
+            field = field.child
+        if isinstance(field, serializers.ModelSerializer) and not field.write_only:
+            nested.append(field)
+    expandable = getattr(serializer.Meta, "expandable_fields", {})
+    nested.extend(serializer_class(expand={}) for serializer_class, _ in expandable.values())
+    for field in nested:
+        labels |= dependencies(field, field.Meta.model)
+    return labels
+
+
+# -------------------- VIEWSET MIXINS --------------------
+class CatalogVersionMixin:
+    """
+    Looks up the versions of every model a ViewSet's serializer renders,
+    plus `filter_dependencies`: models its filters or extra actions read
+    without rendering them (e.g. filtering products by collection).
+    """
+    filter_dependencies = []
+
+    def get_cache_dependencies(self):
+        cls = type(self)
+        if "_cache_dependencies" not in cls.__dict__:
+            serializer = self.get_serializer_class()()
+            labels = dependencies(serializer, serializer.Meta.model)
+            labels |= {model._meta.label_lower for model in self.filter_dependencies}
+            cls._cache_dependencies = sorted(labels)
+        return cls._cache_dependencies
+
+    def get_catalog_versions(self, request):
+        # Fetched once per request, shared by the response cache and conditional GETs
+        if not hasattr(request, "_catalog_versions"):
+            request._catalog_versions = get_versions(self.get_cache_dependencies())
+        return request._catalog_versions
+
+
+class CatalogCacheMixin(CatalogVersionMixin):
+    """
+    Cache the serialized output of list/retrieve actions. Keys combine the
+    action, path, query params (including page) and the versions of every
+    model the serializer renders; receivers in bridal_api.signals bump those
+    versions on writes.
+    """
+    cache_timeout = DEFAULT_TIMEOUT  # The cache alias' TIMEOUT
+
+    def get_cache_key(self, request):
+        versions = self.get_catalog_versions(request)
+        params = urlencode(sorted(request.query_params.lists()), doseq=True)
+        raw = f"{self.action}|{request.path}|{params}|{sorted(versions.items())}"
+        return f"catalog:response:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        cache = get_cache()
+        key = self.get_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            response = Response(data)
+            response["X-Cache"] = "HIT"
+            return response
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, self.cache_timeout)
+        response["X-Cache"] = "MISS"
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,44 @@
+# bridal_api/conditional.py
+import hashlib
+from urllib.parse import urlencode
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cache import CatalogVersionMixin
+
+
+class ConditionalGetMixin(CatalogVersionMixin):
+    """
+    ETag / Last-Modified support for list/retrieve actions. Validators come
+    from the catalog version tokens (nanosecond timestamps bumped by the
+    receivers in bridal_api.signals) of every model the serializer renders
+    and of the ViewSet's filter_dependencies, so a 304 costs no query and
+    no serialization.
+    """
+
+    def get_validators(self, request):
+        versions = self.get_catalog_versions(request)
+        params = urlencode(sorted(request.query_params.lists()), doseq=True)
+        media_type = getattr(request, "accepted_media_type", "")
+        raw = f"{self.action}|{request.path}|{params}|{media_type}|{sorted(versions.items())}"
+        etag = quote_etag(hashlib.sha1(raw.encode("utf-8")).hexdigest())
+        last_modified = max(versions.values()) // 1_000_000_000
+        return f"W/{etag}", last_modified
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request)
+        response = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,85 @@
+# bridal_api/counts.py
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .cache import get_cache
+
+
+def _timeout():
+    return getattr(settings, "COUNT_CACHE_TIMEOUT", 600)
+
+
+# -------------------- TABLE COUNTERS --------------------
+# Whole-table row counts live in the cache, adjusted by signal receivers
+# (bridal_api.signals) and by bulk paths that bypass signals. They expire
+# after COUNT_CACHE_TIMEOUT and are recounted, so drift cannot accumulate.
+def _table_key(model):
+    return f"count:table:{model._meta.label_lower}"
+
+
+def table_count(model):
+    cache = get_cache()
+    value = cache.get(_table_key(model))
+    if value is None:
+        value = model._default_manager.count()
+        cache.add(_table_key(model), value, _timeout())
+    return value
+
+
+def adjust(model, delta):
+    """Add `delta` to the model's counter once the surrounding transaction commits."""
+    def apply():
+        try:
+            get_cache().incr(_table_key(model), delta)
+        except ValueError:
+            pass  # Not cached yet; the next read counts the table
+    transaction.on_commit(apply)
+
+
+# -------------------- QUERY ESTIMATES --------------------
+def planner_estimate(queryset):
+    """The PostgreSQL planner's row estimate for a queryset; None on other databases."""
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def cached_count(queryset):
+    """Exact count of a filtered queryset, reused for COUNT_CACHE_TIMEOUT seconds."""
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.sha256(f"{queryset.db}|{sql}|{params!r}".encode("utf-8")).hexdigest()
+    cache = get_cache()
+    value = cache.get(f"count:query:{digest}")
+    if value is None:
+        value = queryset.count()
+        cache.set(f"count:query:{digest}", value, _timeout())
+    return value
+
+
+def estimate_count(queryset, exact_limit):
+    """
+    Return (count, approximate). Results of up to `exact_limit` rows are
+    counted exactly with a LIMITed COUNT; larger ones use the table counter
+    when unfiltered, else the planner estimate, else a cached count.
+    """
+    queryset = queryset.order_by()
+    probe = queryset[:exact_limit + 1].count()
+    if probe <= exact_limit:
+        return probe, False
+    if not queryset.query.where and not queryset.query.distinct_fields:
+        estimate = table_count(queryset.model)
+    else:
+        estimate = planner_estimate(queryset)
+        if estimate is None:
+            estimate = cached_count(queryset)
+    return max(estimate, exact_limit + 1), True
@@ -0,0 +1,47 @@
+# bridal_api/exports.py
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import action
+
+from .permissions import IsAdmin
+from .renderers import CSVRenderer, NDJSONRenderer
+
+EXPORT_RENDERERS = [NDJSONRenderer, CSVRenderer]
+
+
+def export_response(request, queryset, fields, filename, chunk_size=2000):
+    """
+    Stream `fields` of every row in `queryset` as NDJSON or CSV, following
+    the renderer DRF negotiated (Accept header, ?format= or a .csv/.ndjson
+    suffix). Rows come from a server-side iterator, so memory stays flat
+    whatever the row count.
+    """
+    renderer = request.accepted_renderer
+    rows = queryset.prefetch_related(None).values_list(*fields).iterator(chunk_size=chunk_size)
+    response = StreamingHttpResponse(
+        renderer.stream(fields, rows, chunk_size),
+        content_type=f"{renderer.media_type}; charset={renderer.charset}",
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{renderer.format}"'
+    return response
+
+
+class ExportMixin:
+    """
+    Adds GET <list>/export/ to a ViewSet: the list's filters and ordering,
+    no pagination, streamed as NDJSON or CSV. Admins only.
+    """
+    export_fields = []       # values_list() lookups, also the column names
+    export_chunk_size = 2000
+
+    def get_export_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    def get_export_filename(self):
+        return self.basename if getattr(self, "basename", None) else "export"
+
+    @action(detail=False, methods=["get"], renderer_classes=EXPORT_RENDERERS, permission_classes=[IsAdmin])
+    def export(self, request, *args, **kwargs):
+        return export_response(
+            request, self.get_export_queryset(), self.export_fields,
+            self.get_export_filename(), self.export_chunk_size,
+        )
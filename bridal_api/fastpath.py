@@ -0,0 +1,246 @@
+# bridal_api/fastpath.py
+import decimal
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import fields as drf_fields, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+# Serializer fields whose to_representation returns database values unchanged
+_IDENTITY = {
+    drf_fields.IntegerField.to_representation,
+    drf_fields.CharField.to_representation,
+    drf_fields.BooleanField.to_representation,
+    drf_fields.ReadOnlyField.to_representation,
+}
+
+
+# -------------------- CONVERTERS --------------------
+def _decimal_converter(field):
+    coerce = getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce or field.localize or field.normalize_output or field.decimal_places is None:
+        return field.to_representation
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    quantum = decimal.Decimal(".1") ** field.decimal_places
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return f"{value.quantize(quantum, rounding=rounding, context=context):f}"
+    return convert
+
+
+def _datetime_converter(field):
+    output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+    tz = field.timezone if hasattr(field, "timezone") else field.default_timezone()
+    if output_format is None or output_format.lower() != drf_fields.ISO_8601 or tz is None:
+        return field.to_representation
+
+    def convert(value):
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(tz).isoformat()
+        return value[:-6] + "Z" if value.endswith("+00:00") else value
+    return convert
+
+
+def converter(field):
+    """A function turning a non-null database value into `field`'s output."""
+    method = type(field).to_representation
+    if method in _IDENTITY:
+        return None
+    if isinstance(field, drf_fields.ChoiceField) and method is drf_fields.ChoiceField.to_representation:
+        if all(isinstance(key, str) for key in field.choice_strings_to_values.values()):
+            return None
+    if method is drf_fields.DecimalField.to_representation:
+        return _decimal_converter(field)
+    if method is drf_fields.DateTimeField.to_representation:
+        return _datetime_converter(field)
+    return field.to_representation
+
+
+def _row_class(model):
+    """Attribute holder carrying the model's properties, for computed fields."""
+    attrs = {}
+    for cls in reversed(model.__mro__):
+        attrs.update({name: value for name, value in vars(cls).items() if isinstance(value, property)})
+    return type(f"{model.__name__}Row", (), attrs)
+
+
+# -------------------- PLANS --------------------
+class RowPlan:
+    """
+    Precompiled mapping from .values() rows to one serializer's output.
+
+    Built from a serializer instance (so ?fields= and ?expand= apply), then
+    applied to every row. Plain columns go through converters matching the
+    DRF field, single primary keys are read from the FK column, expanded
+    forward FKs are read from joined columns and nested to-many serializers
+    cost one extra .values() query per level. Fields computed from the
+    instance (method fields, properties) must list the columns they read in
+    the serializer's Meta.computed_sources.
+    """
+    def __init__(self, model, prefix=""):
+        self.model = model
+        self.prefix = prefix
+        self.pk_key = prefix + model._meta.pk.attname
+        self.columns = [self.pk_key]
+        self.steps = []          # (field name, function(row) -> value)
+        self.children = []       # (field name, relation, RowPlan) for nested to-many serializers
+        self.computed = []       # Columns copied onto the row object for computed fields
+        self.row_class = None
+
+    def add_column(self, lookup):
+        key = self.prefix + lookup
+        if key not in self.columns:
+            self.columns.append(key)
+        return key
+
+    def add_scalar(self, name, field, source):
+        key = self.add_column(source)
+        convert = converter(field)
+        if convert is None:
+            self.steps.append((name, lambda row: row[key]))
+        else:
+            self.steps.append((name, lambda row: None if row[key] is None else convert(row[key])))
+
+    def add_nested(self, name, child):
+        self.columns.extend(column for column in child.columns if column not in self.columns)
+        pk_key = child.pk_key
+        self.steps.append((name, lambda row: None if row[pk_key] is None else child.build(row)))
+
+    def add_computed(self, name, field, sources):
+        for source in sources:
+            self.add_column(source)
+            if source not in self.computed:
+                self.computed.append(source)
+        if self.row_class is None:
+            self.row_class = _row_class(self.model)
+
+        def compute(row):
+            obj = self.row_class()
+            obj.__dict__.update({source: row[self.prefix + source] for source in self.computed})
+            attribute = field.get_attribute(obj)
+            return None if attribute is None else field.to_representation(attribute)
+        self.steps.append((name, compute))
+
+    def build(self, row):
+        return {name: step(row) for name, step in self.steps}
+
+    def render(self, rows):
+        """Output dicts for `rows`, filling nested to-many fields with one query each."""
+        rows = list(rows)
+        data = [self.build(row) for row in rows]
+        for name, relation, child in self.children:
+            fk = relation.field.attname
+            ids = [row[self.pk_key] for row in rows]
+            grouped = {pk: [] for pk in ids}
+            queryset = relation.related_model._default_manager.filter(**{f"{fk}__in": ids})
+            child_rows = list(queryset.values(*child.columns, *([fk] if fk not in child.columns else [])))
+            for child_row, item in zip(child_rows, child.render(child_rows)):
+                grouped[child_row[fk]].append(item)
+            for pk, item in zip(ids, data):
+                item[name] = grouped[pk]
+        return data
+
+    def values(self, queryset, extra=()):
+        """`queryset` as .values() rows carrying everything this plan reads."""
+        columns = self.columns + [name for name in extra if name not in self.columns]
+        return queryset.prefetch_related(None).values(*columns)
+
+
+def _is_column(model, name):
+    try:
+        return model._meta.get_field(name).concrete
+    except FieldDoesNotExist:
+        return False
+
+
+def compile_plan(serializer, model, prefix=""):
+    """Compile a RowPlan for a ModelSerializer instance, or None if a field can't be read from rows."""
+    plan = RowPlan(model, prefix)
+    computed = getattr(getattr(serializer, "Meta", None), "computed_sources", {})
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in computed:
+            if prefix and not all(_is_column(model, source) for source in computed[name]):
+                return None  # Annotations only exist on the top-level queryset
+            plan.add_computed(name, field, computed[name])
+            continue
+        if field.source == "*" or "." in field.source:
+            return None
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+
+        if not model_field.is_relation:
+            plan.add_scalar(name, field, field.source)
+        elif isinstance(field, serializers.ListSerializer) and model_field.one_to_many and not prefix:
+            child = compile_plan(field.child, model_field.related_model)
+            if child is None:
+                return None
+            plan.steps.append((name, lambda row: []))
+            plan.children.append((name, model_field, child))
+        elif model_field.many_to_many or model_field.one_to_many:
+            return None
+        elif isinstance(field, serializers.ModelSerializer):
+            child = compile_plan(field, model_field.related_model, f"{prefix}{field.source}__")
+            if child is None or child.children:
+                return None
+            plan.add_nested(name, child)
+        elif type(field) is serializers.PrimaryKeyRelatedField and field.pk_field is None:
+            # values("<fk>") yields the id, which is what the field renders
+            plan.add_scalar(name, drf_fields.ReadOnlyField(), field.source)
+        else:
+            return None
+    return plan
+
+
+# -------------------- VIEWSET MIXIN --------------------
+def _ordering_keys(queryset, view):
+    """Columns and annotations the queryset (and a keyset paginator) order by."""
+    names = list(queryset.query.order_by) + list(getattr(view, "ordering", None) or [])
+    keys = []
+    for name in names:
+        if not isinstance(name, str):
+            continue
+        name = name.lstrip("-")
+        if name in queryset.query.annotations:
+            keys.append(name)
+            continue
+        try:
+            field = queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if field.concrete and not field.many_to_many:
+            keys.append(field.attname)
+    return keys
+
+
+class FastListMixin:
+    """
+    Opt-in read path for list actions: rows are fetched with .values() and
+    rendered through a RowPlan compiled from the serializer, skipping model
+    instances and per-row serializer machinery. Output is identical to the
+    serializer's; serializers the plan cannot express use the normal path.
+    """
+    fast_list = True
+
+    def list(self, request, *args, **kwargs):
+        if not self.fast_list:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        plan = compile_plan(self.get_serializer(), queryset.model)
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        rows = plan.values(queryset, extra=_ordering_keys(queryset, self))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(plan.render(page))
+        return Response(plan.render(rows))
@@ -1,18 +1,91 @@
 # bridal_api/filters.py
 import django_filters
-from .models import Product, Category, Collection, Designer
+from django.db.models import Case, Count, Exists, IntegerField, OuterRef, Value, When
+from .models import Product, Category, Collection, Designer, Order, OrderCategory, Payment
 
 # Product filter
 class ProductFilter(django_filters.FilterSet):
     min_price = django_filters.NumberFilter(field_name="price", lookup_expr='gte')
     max_price = django_filters.NumberFilter(field_name="price", lookup_expr='lte')
     category = django_filters.NumberFilter(field_name="category__id", lookup_expr='exact')
-    designer = django_filters.NumberFilter(field_name="designer__id", lookup_expr='exact')
-    collection = django_filters.NumberFilter(field_name="collection__id", lookup_expr='exact')
+    designer = django_filters.NumberFilter(field_name="collections__designers__id", lookup_expr='exact', distinct=True)
+    collection = django_filters.NumberFilter(field_name="collections__id", lookup_expr='exact', distinct=True)
+    # rating_average is annotated by ProductViewSet.get_queryset
+    min_rating = django_filters.NumberFilter(field_name="rating_average", lookup_expr='gte')
 
     class Meta:
         model = Product
-        fields = ['category', 'designer', 'collection', 'min_price', 'max_price']
+        fields = {
+            'rating_count': ['gte'],
+        }
+
+
+# Order filter (also applied to order item exports)
+class OrderFilter(django_filters.FilterSet):
+    created_after = django_filters.IsoDateTimeFilter(field_name="created_at", lookup_expr='gte')
+    created_before = django_filters.IsoDateTimeFilter(field_name="created_at", lookup_expr='lt')
+    # Semi-join on the OrderCategory link rather than joining items -> products
+    category = django_filters.NumberFilter(method="filter_category")
+    items__product__category = django_filters.NumberFilter(method="filter_category")
+
+    class Meta:
+        model = Order
+        fields = ["user", "status"]
+
+    def filter_category(self, queryset, name, value):
+        return queryset.filter(Exists(OrderCategory.objects.filter(order=OuterRef("pk"), category_id=value)))
+
+
+# Payment filter
+class PaymentFilter(django_filters.FilterSet):
+    created_after = django_filters.IsoDateTimeFilter(field_name="created_at", lookup_expr='gte')
+    created_before = django_filters.IsoDateTimeFilter(field_name="created_at", lookup_expr='lt')
+
+    class Meta:
+        model = Payment
+        fields = ["user", "status"]
+
+
+# Product facets
+PRICE_BUCKETS = [0, 100, 250, 500, 1000, 2500]
+
+
+def product_facets(queryset, price_buckets=PRICE_BUCKETS):
+    """
+    Facet counts for an already filtered product queryset: one grouped
+    query for category x price bucket, one for collections.
+    """
+    queryset = queryset.order_by()
+    bounds = list(zip(price_buckets, price_buckets[1:] + [None]))
+    bucket = Case(
+        *[When(price__lt=upper, then=Value(index)) for index, (_, upper) in enumerate(bounds) if upper is not None],
+        default=Value(len(bounds) - 1),
+        output_field=IntegerField(),
+    )
+    categories, prices = {}, [0] * len(bounds)
+    rows = queryset.annotate(bucket=bucket).values(
+        "category_id", "category__name", "bucket"
+    ).annotate(count=Count("id", distinct=True))
+    for row in rows:
+        entry = categories.setdefault(row["category_id"], {"id": row["category_id"], "name": row["category__name"], "count": 0})
+        entry["count"] += row["count"]
+        prices[row["bucket"]] += row["count"]
+
+    collections = queryset.filter(collections__isnull=False).values(
+        "collections__id", "collections__name"
+    ).annotate(count=Count("id", distinct=True)).order_by("collections__name")
+
+    return {
+        "category": sorted(categories.values(), key=lambda entry: entry["name"]),
+        "price": [
+            {"min": lower, "max": upper, "count": count}
+            for (lower, upper), count in zip(bounds, prices)
+        ],
+        "collection": [
+            {"id": row["collections__id"], "name": row["collections__name"], "count": row["count"]}
+            for row in collections
+        ],
+    }
 
 
 # Category filter
@@ -0,0 +1,132 @@
+# bridal_api/gateway.py
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class GatewayError(Exception):
+    """The payment gateway answered with something unusable."""
+
+
+class GatewayUnavailable(GatewayError):
+    """The gateway timed out, failed, or the circuit breaker is open."""
+
+
+# -------------------- CIRCUIT BREAKER --------------------
+class CircuitBreaker:
+    """
+    Fails fast once `threshold` calls in a row have failed. After
+    `reset_after` seconds one trial call is let through; a success closes
+    the circuit again, a failure keeps it open for another period.
+    """
+    def __init__(self, threshold=5, reset_after=30.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.clock() - self.opened_at >= self.reset_after:
+                self.opened_at = self.clock()  # One trial call per period
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = self.clock()
+
+
+# -------------------- CLIENT --------------------
+class ChapaClient:
+    """
+    Chapa API client on one requests.Session, so connections (and their TLS
+    sessions) are pooled and reused across requests in the process. Every
+    call has connect/read timeouts. Connection failures are retried for any
+    method; read errors and 502/503/504 answers only for GET, so a payment
+    is never initialized twice. Failures feed a CircuitBreaker.
+    """
+    def __init__(self, base_url=None, secret_key=None, timeout=None, retries=None,
+                 backoff=None, pool_size=None, breaker=None):
+        self.base_url = (base_url or settings.CHAPA_BASE_URL).rstrip("/")
+        self.timeout = timeout or (settings.CHAPA_CONNECT_TIMEOUT, settings.CHAPA_READ_TIMEOUT)
+        self.breaker = breaker or CircuitBreaker(settings.CHAPA_BREAKER_THRESHOLD, settings.CHAPA_BREAKER_RESET)
+        retries = settings.CHAPA_MAX_RETRIES if retries is None else retries
+        retry = Retry(
+            total=retries, connect=retries, read=retries, status=retries,
+            backoff_factor=0.2 if backoff is None else backoff,
+            status_forcelist=(502, 503, 504), allowed_methods=frozenset({"GET"}), raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size or settings.CHAPA_POOL_SIZE, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        key = settings.CHAPA_SECRET_KEY if secret_key is None else secret_key
+        self.session.headers.update({"Authorization": f"Bearer {key}"})
+
+    def request(self, method, path, **kwargs):
+        if not self.breaker.allow():
+            raise GatewayUnavailable("Payment gateway circuit is open.")
+        try:
+            response = self.session.request(method, f"{self.base_url}/{path}", timeout=self.timeout, **kwargs)
+        except requests.RequestException as exc:
+            self.breaker.record_failure()
+            raise GatewayUnavailable(str(exc)) from exc
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            raise GatewayUnavailable(f"Payment gateway answered {response.status_code}.")
+        self.breaker.record_success()
+        try:
+            return response.json()
+        except ValueError as exc:
+            raise GatewayError("Payment gateway returned invalid JSON.") from exc
+
+    def initialize(self, payload):
+        return self.request("POST", "transaction/initialize", json=payload)
+
+    def verify(self, reference):
+        return self.request("GET", f"transaction/verify/{reference}")
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide ChapaClient, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ChapaClient()
+        return _client
+
+
+def reset_client():
+    """Drop the shared client (after settings change, e.g. in tests)."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
@@ -0,0 +1,122 @@
+# bridal_api/idempotency.py
+import hashlib
+import json
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from drf_yasg import openapi
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+from .renderers import FastJSONRenderer
+
+HEADER = "Idempotency-Key"
+IDEMPOTENCY_HEADER = openapi.Parameter(
+    HEADER, openapi.IN_HEADER, type=openapi.TYPE_STRING, required=False,
+    description="Client-chosen key; a retry with the same key replays the first response.",
+)
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, "IDEMPOTENCY_KEY_TTL", 86400))
+
+
+def _lease():
+    return timedelta(seconds=getattr(settings, "IDEMPOTENCY_KEY_LEASE", 120))
+
+
+def fingerprint(request):
+    """Digest of the parsed request body, to spot a key reused for a different request."""
+    body = json.dumps(request.data, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def purge_expired(batch_size=1000):
+    """Delete keys older than IDEMPOTENCY_KEY_TTL in batches; returns how many went."""
+    purged = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(created_at__lt=timezone.now() - _ttl())
+            .order_by("created_at").values_list("pk", flat=True)[:batch_size]
+        )
+        if not ids:
+            return purged
+        purged += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
+
+
+class IdempotencyMixin:
+    """
+    Honours an Idempotency-Key header on the view's POST handler. The first
+    request claims the key (committed before the handler runs), and its
+    response is stored as zlib-compressed JSON. A retry with the same key
+    replays that response without running the handler again. A retry that
+    arrives while the first is still running gets 409, and reusing a key
+    for a different body gets 422. Raised errors (such as validation
+    errors) and 5xx responses release the key so the client can retry. A
+    claim still unfinished after IDEMPOTENCY_KEY_LEASE seconds is taken to
+    be abandoned by a dead worker and can be claimed again. Keys are per
+    user and scope and live for IDEMPOTENCY_KEY_TTL seconds (see the
+    purge_idempotency_keys command).
+    """
+    idempotency_scope = None
+
+    def idempotent_response(self, handler, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return handler(request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({"detail": f"{HEADER} must be at most 255 characters."}, status=status.HTTP_400_BAD_REQUEST)
+
+        digest = fingerprint(request)
+        lookup = {"user": request.user, "scope": self.idempotency_scope, "key": key}
+        record = self.claim(digest, lookup)
+        if record is None:
+            now = timezone.now()
+            stale = Q(created_at__lt=now - _ttl()) | Q(status_code__isnull=True, created_at__lt=now - _lease())
+            record = IdempotencyKey.objects.filter(**lookup).exclude(stale).first()
+            if record is not None:
+                return self.replay(record, digest)
+            # Past its TTL (the purge just has not run yet), or claimed by a
+            # request that never finished: the key is free again
+            IdempotencyKey.objects.filter(stale, **lookup).delete()
+            record = self.claim(digest, lookup)
+            if record is None:  # Claimed by a concurrent retry in between
+                return Response({"detail": "Request in progress; retry later."}, status=status.HTTP_409_CONFLICT)
+
+        try:
+            response = handler(request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            record.delete()
+            return response
+        # An update rather than save(): a claim reclaimed after its lease has gone
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            status_code=response.status_code, response_body=zlib.compress(FastJSONRenderer().render(response.data)),
+        )
+        return response
+
+    def claim(self, digest, lookup):
+        """Create the key's record, or return None if it already exists."""
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(fingerprint=digest, **lookup)
+        except IntegrityError:
+            return None
+
+    def replay(self, record, digest):
+        if record.fingerprint != digest:
+            return Response(
+                {"detail": f"This {HEADER} was used for a different request."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if record.status_code is None:
+            return Response({"detail": "A request with this key is still in progress."}, status=status.HTTP_409_CONFLICT)
+        data = json.loads(zlib.decompress(record.response_body)) if record.response_body else None
+        return Response(data, status=record.status_code, headers={"Idempotent-Replayed": "true"})
@@ -0,0 +1,183 @@
+# bridal_api/importers.py
+import codecs
+import csv
+import io
+import json
+import re
+from itertools import islice
+
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from rest_framework import serializers
+
+from . import cache, search, services
+from .models import Category, Product, StockShard
+
+FORMATS = ("csv", "jsonl")
+UPSERT_FIELDS = ["name", "price", "category"]
+OPTIONAL_FIELDS = ["description", "stock"]  # Only updated on rows that carry them
+INVALID_UTF8 = "Invalid UTF-8 byte sequence."
+_undecodable = re.compile("[\udc80-\udcff]")  # Bytes kept by errors="surrogateescape"
+
+
+class ProductImportRowSerializer(serializers.Serializer):
+    """
+    Validates one import row without touching the database; categories are
+    resolved per batch by ProductImporter.
+    """
+    sku = serializers.CharField(max_length=64)
+    name = serializers.CharField(max_length=200)
+    description = serializers.CharField(required=False, allow_blank=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    stock = serializers.IntegerField(min_value=0, required=False)
+    category = serializers.CharField(max_length=255, help_text="Category id or exact name")
+
+
+# -------------------- READERS --------------------
+def detect_format(filename, default="csv"):
+    for fmt in FORMATS:
+        if (filename or "").lower().endswith(f".{fmt}"):
+            return fmt
+    if (filename or "").lower().endswith(".ndjson"):
+        return "jsonl"
+    return default
+
+
+def _text(stream):
+    """
+    Decode a binary stream lazily; text streams pass through. Invalid UTF-8
+    bytes are kept as lone surrogates so read_rows can reject just their row.
+    """
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return codecs.getreader("utf-8-sig")(stream, errors="surrogateescape")
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row dict or error message) without loading the whole file."""
+    stream = _text(stream)
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as exc:
+                yield reader.line_num + 1, f"Invalid CSV: {exc}"  # The failing line is not counted yet
+                continue
+            if any(_undecodable.search(value) for value in row.values() if isinstance(value, str)):
+                yield reader.line_num, INVALID_UTF8
+            else:
+                yield reader.line_num, row
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        if _undecodable.search(line):
+            yield line_number, INVALID_UTF8
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_number, f"Invalid JSON: {exc}"
+            continue
+        yield line_number, row if isinstance(row, dict) else "Each line must be a JSON object."
+
+
+# -------------------- IMPORTER --------------------
+class ProductImporter:
+    """
+    Streams rows, validates them in batches and upserts each batch on sku
+    with bulk_create(update_conflicts=True). A bad row is reported and
+    skipped; it never aborts the rest of the file. Rows that leave out
+    description or stock keep the existing values (or the model defaults
+    for new products), so a batch is upserted in groups by the columns its
+    rows carry.
+    """
+    batch_size = 500
+
+    def __init__(self, batch_size=None):
+        if batch_size:
+            self.batch_size = batch_size
+        self.imported = 0
+        self.errors = []
+
+    def run(self, stream, fmt="csv"):
+        rows = read_rows(stream, fmt)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch)
+        return self.report()
+
+    def report(self):
+        return {"imported": self.imported, "failed": len(self.errors), "errors": self.errors}
+
+    def error(self, line, errors):
+        self.errors.append({"line": line, "errors": errors})
+
+    def resolve_categories(self, refs):
+        """Map category references (ids or names) to Category ids with one query."""
+        ids = {int(ref) for ref in refs if ref.isdigit()}
+        names = {ref for ref in refs if not ref.isdigit()}
+        resolved = {}
+        for pk, name in Category.objects.filter(Q(pk__in=ids) | Q(name__in=names)).values_list("pk", "name"):
+            resolved[str(pk)] = pk
+            resolved.setdefault(name, pk)
+        return resolved
+
+    def import_batch(self, batch):
+        valid = []
+        for line, row in batch:
+            if isinstance(row, str):
+                self.error(line, {"non_field_errors": [row]})
+                continue
+            serializer = ProductImportRowSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((line, serializer.validated_data))
+            else:
+                self.error(line, serializer.errors)
+
+        categories = self.resolve_categories({data["category"].strip() for _, data in valid})
+        products = {}
+        for line, data in valid:
+            category_id = categories.get(data["category"].strip())
+            if category_id is None:
+                self.error(line, {"category": [f"Unknown category '{data['category']}'."]})
+                continue
+            optional = {field: data[field] for field in OPTIONAL_FIELDS if field in data}
+            # A later row for the same sku in this batch wins
+            products[data["sku"]] = (line, Product(
+                sku=data["sku"], name=data["name"], price=data["price"], category_id=category_id, **optional,
+            ), tuple(optional))
+        if not products:
+            return
+
+        groups = {}
+        for _, product, supplied in products.values():
+            groups.setdefault(supplied, []).append(product)
+        objects = [product for _, product, _ in products.values()]
+        stocked = [sku for sku, (_, _, supplied) in products.items() if "stock" in supplied]
+        try:
+            with transaction.atomic():
+                for supplied, group in groups.items():
+                    Product.objects.bulk_create(
+                        group, update_conflicts=True, unique_fields=services.conflict_target("sku"),
+                        update_fields=UPSERT_FIELDS + list(supplied),
+                    )
+                if any(obj.pk is None for obj in objects):
+                    # Backends that cannot return ids from an upsert
+                    pks = dict(Product.objects.filter(sku__in=products).values_list("sku", "pk"))
+                    for obj in objects:
+                        obj.pk = pks[obj.sku]
+                if stocked:
+                    # An imported stock level replaces the shards of sharded products
+                    StockShard.objects.filter(product__sku__in=stocked, product__stock_shards__gt=0).update(stock=0)
+                search.index_objects(objects)
+        except DatabaseError as exc:
+            for line, _, _ in products.values():
+                self.error(line, {"non_field_errors": [f"Batch failed: {exc}"]})
+            return
+        cache.invalidate(Product)
+        self.imported += len(objects)
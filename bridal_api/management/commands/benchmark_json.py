@@ -0,0 +1,62 @@
+import io
+import timeit
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from bridal_api import renderers
+
+
+def order_page(rows, items):
+    """An order-list page shaped like OrderSerializer output, with payment-style fields."""
+    now = timezone.now()
+    return {
+        "next": None,
+        "previous": None,
+        "results": [
+            {
+                "id": i,
+                "user": i % 50,
+                "reference": uuid.uuid4(),
+                "total_price": Decimal("1234.50") + i,
+                "status": "pending",
+                "created_at": now - timedelta(minutes=i),
+                "items": [
+                    {"id": i * items + j, "product": j, "quantity": j + 1, "price": Decimal("99.99") * (j + 1)}
+                    for j in range(items)
+                ],
+            }
+            for i in range(rows)
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare the stdlib JSON renderer/parser with bridal_api.renderers on an order-list payload."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=500)
+        parser.add_argument("--items", type=int, default=3)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def best(self, func, repeat):
+        return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+
+    def handle(self, *args, **options):
+        if renderers.orjson is None:
+            self.stdout.write(self.style.WARNING("orjson is not installed; both sides use the stdlib encoder."))
+        data = order_page(options["rows"], options["items"])
+        body = JSONRenderer().render(data)
+        pairs = [
+            ("render", lambda: JSONRenderer().render(data), lambda: renderers.FastJSONRenderer().render(data)),
+            ("parse", lambda: JSONParser().parse(io.BytesIO(body)), lambda: renderers.FastJSONParser().parse(io.BytesIO(body))),
+        ]
+        self.stdout.write(f"{options['rows']} orders x {options['items']} items, {len(body)} bytes, best of {options['repeat']}")
+        for name, stdlib, fast in pairs:
+            slow_ms, fast_ms = self.best(stdlib, options["repeat"]), self.best(fast, options["repeat"])
+            self.stdout.write(f"{name:<7} stdlib {slow_ms:8.2f} ms   fast {fast_ms:8.2f} ms   x{slow_ms / fast_ms:.1f}")
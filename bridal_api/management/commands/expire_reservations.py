@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from bridal_api.services import expire_reservations
+
+
+class Command(BaseCommand):
+    help = "Delete expired cart stock reservations; run it periodically (cron, Celery beat)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        expired = expire_reservations(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} reservation(s)."))
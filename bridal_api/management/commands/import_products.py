@@ -0,0 +1,28 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bridal_api.importers import FORMATS, ProductImporter, detect_format
+
+
+class Command(BaseCommand):
+    help = "Stream products from a CSV or JSONL file and upsert them on sku."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV (header row) or JSONL file; '-' is not supported.")
+        parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension, then csv.")
+        parser.add_argument("--batch-size", type=int, default=ProductImporter.batch_size)
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or detect_format(options["path"])
+        try:
+            stream = open(options["path"], "rb")
+        except OSError as exc:
+            raise CommandError(str(exc))
+        with stream:
+            report = ProductImporter(batch_size=options["batch_size"]).run(stream, fmt)
+
+        for error in report["errors"]:
+            self.stderr.write(f"line {error['line']}: {json.dumps(error['errors'])}")
+        style = self.style.SUCCESS if not report["failed"] else self.style.WARNING
+        self.stdout.write(style(f"Imported {report['imported']} product(s), {report['failed']} row(s) failed."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from bridal_api import services
+
+
+class Command(BaseCommand):
+    help = "Recompute Product rating_count/rating_sum/histogram from Review rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = services.rebuild_review_aggregates(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt review aggregates for {count} product(s)."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bridal_api import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for products, collections and designers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "kinds", nargs="*",
+            help=f"Only rebuild these kinds: {', '.join(sorted(search.SEARCH_MODELS))} (default: all).",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        unknown = set(options["kinds"]) - set(search.SEARCH_MODELS)
+        if unknown:
+            raise CommandError(f"Unknown kind(s): {', '.join(sorted(unknown))}")
+        backend = type(search.get_index()).__name__
+        for kind in options["kinds"] or sorted(search.SEARCH_MODELS):
+            count = search.rebuild(kind, batch_size=options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"Indexed {count} {kind} row(s) with {backend}."))
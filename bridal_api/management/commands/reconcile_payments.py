@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from bridal_api.reconciliation import reconcile_payments
+
+
+class Command(BaseCommand):
+    help = "Verify Pending payments with the gateway in batches and record the ones that settled."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent gateway calls.")
+        parser.add_argument("--min-age", type=int, default=10, help="Skip payments younger than this (minutes).")
+        parser.add_argument("--abandon-after", type=int, default=24, help="Fail payments still open after this (hours).")
+
+    def handle(self, *args, **options):
+        stats = reconcile_payments(
+            batch_size=options["batch_size"],
+            workers=options["workers"],
+            min_age=timedelta(minutes=options["min_age"]),
+            abandon_after=timedelta(hours=options["abandon_after"]),
+        )
+        style = self.style.SUCCESS if not stats["unreachable"] else self.style.WARNING
+        self.stdout.write(style(
+            f"Checked {stats['checked']} payment(s): {stats['updated']} updated, {stats['unreachable']} unreachable."
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bridal_api.models import Product
+from bridal_api.services import reshard_stock
+
+
+class Command(BaseCommand):
+    help = "Split products' stock over N shard rows for flash sales, or fold it back with --shards 0."
+
+    def add_arguments(self, parser):
+        parser.add_argument("product_ids", nargs="+", type=int)
+        parser.add_argument("--shards", type=int, default=8, help="Shard count; 0 turns sharding off.")
+
+    def handle(self, *args, **options):
+        if not 0 <= options["shards"] <= 256:
+            raise CommandError("--shards must be between 0 and 256.")
+        for product_id in options["product_ids"]:
+            try:
+                product = reshard_stock(product_id, options["shards"])
+            except Product.DoesNotExist:
+                raise CommandError(f"Product {product_id} does not exist.")
+            self.stdout.write(f"{product.name}: {product.stock_on_hand} in stock over {product.stock_shards} shard(s)")
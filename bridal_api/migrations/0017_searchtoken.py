@@ -0,0 +1,102 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:25
+
+from collections import Counter
+
+from django.db import OperationalError, migrations, models
+
+FTS_KINDS = ['product', 'collection', 'designer']
+# kind -> (model, name field, body field), as bridal_api.search.SEARCH_MODELS
+SEARCH_FIELDS = {
+    'product': ('Product', 'name', 'description'),
+    'collection': ('Collection', 'name', 'description'),
+    'designer': ('Designer', 'name', 'bio'),
+}
+
+
+def create_fts_tables(apps, schema_editor):
+    # SQLite gets FTS5 tables (rowid = object pk); other databases use SearchToken only
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for kind in FTS_KINDS:
+        try:
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS bridal_api_fts_{kind} "
+                "USING fts5(name, body, tokenize='unicode61 remove_diacritics 2')"
+            )
+        except OperationalError:
+            # SQLite built without FTS5; bridal_api.search falls back to SearchToken
+            return
+
+
+def backfill_search_index(apps, schema_editor):
+    # Index existing rows, so search works straight after deploy
+    from bridal_api.search import BODY_WEIGHT, NAME_WEIGHT, tokenize
+
+    connection = schema_editor.connection
+    fts = connection.vendor == 'sqlite' and 'bridal_api_fts_product' in connection.introspection.table_names()
+    SearchToken = apps.get_model('bridal_api', 'SearchToken')
+    for kind, (model_name, name_field, body_field) in SEARCH_FIELDS.items():
+        rows = (
+            apps.get_model('bridal_api', model_name).objects
+            .order_by('pk').values_list('pk', name_field, body_field)
+        )
+        batch = []
+        for pk, name, body in rows.iterator(chunk_size=1000):
+            if fts:
+                batch.append([pk, name or '', body or ''])
+            else:
+                weights = Counter()
+                for token in tokenize(name):
+                    weights[token] += NAME_WEIGHT
+                for token in tokenize(body):
+                    weights[token] += BODY_WEIGHT
+                batch.extend(
+                    SearchToken(kind=kind, object_id=pk, token=token, weight=weight)
+                    for token, weight in weights.items()
+                )
+            if len(batch) >= 1000:
+                write_index(connection, SearchToken, kind, batch, fts)
+                batch = []
+        write_index(connection, SearchToken, kind, batch, fts)
+
+
+def write_index(connection, SearchToken, kind, batch, fts):
+    if not batch:
+        return
+    if not fts:
+        SearchToken.objects.bulk_create(batch)
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"INSERT INTO bridal_api_fts_{kind} (rowid, name, body) VALUES (%s, %s, %s)", batch)
+
+
+def drop_fts_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for kind in FTS_KINDS:
+        schema_editor.execute(f"DROP TABLE IF EXISTS bridal_api_fts_{kind}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bridal_api', '0016_payment_review'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField(default=1)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'token'], name='bridal_api__kind_e2427c_idx'), models.Index(fields=['kind', 'object_id'], name='bridal_api__kind_a6dff1_idx')],
+            },
+        ),
+        migrations.RunPython(create_fts_tables, drop_fts_tables),
+        migrations.RunPython(backfill_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_order_categories(apps, schema_editor):
+    OrderItem = apps.get_model('bridal_api', 'OrderItem')
+    OrderCategory = apps.get_model('bridal_api', 'OrderCategory')
+    pairs = (
+        OrderItem.objects.filter(product__category__isnull=False)
+        .values_list('order_id', 'product__category_id')
+        .distinct()
+        .order_by()
+    )
+    batch = []
+    for order_id, category_id in pairs.iterator(chunk_size=2000):
+        batch.append(OrderCategory(order_id=order_id, category_id=category_id))
+        if len(batch) >= 2000:
+            OrderCategory.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    OrderCategory.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bridal_api', '0019_product_sku'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderCategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='order_links', to='bridal_api.category')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_links', to='bridal_api.order')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('category', 'order'), name='unique_order_category')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-created_at'], name='bridal_api__created_415f0a_idx'),
+        ),
+        migrations.RunPython(backfill_order_categories, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bridal_api', '0020_order_categories'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['user', '-appointment_date', '-id'], name='bridal_api__user_id_814224_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='bridal_api__user_id_b9a675_idx'),
+        ),
+    ]
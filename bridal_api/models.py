@@ -42,15 +42,61 @@ class Category(models.Model):
 # --------------------------------------
 class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="products")
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)  # Natural key for bulk imports
     name = models.CharField(max_length=200, db_index=True)
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, db_index=True)
     stock = models.PositiveIntegerField(default=0)
+    # Above 0, most of the stock lives in this many StockShard rows so that
+    # concurrent orders do not lock this row; see services.take_from_shards
+    stock_shards = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
+    # Review aggregates, maintained by bridal_api.services.apply_review
+    rating_count = models.PositiveIntegerField(default=0, db_index=True)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
     def __str__(self):
         return self.name
 
+    @property
+    def rating_histogram(self):
+        return {str(stars): getattr(self, f"rating_{stars}") for stars in range(1, 6)}
+
+    @property
+    def stock_on_hand(self):
+        """
+        Units on hand: `stock`, plus the shards' sum for sharded products.
+        Querysets annotated with `shard_stock` (as ProductViewSet's is)
+        supply that sum, so lists take no query per product.
+        """
+        shard_stock = getattr(self, "shard_stock", None)
+        if shard_stock is not None:
+            return self.stock + shard_stock
+        if not self.stock_shards:
+            return self.stock
+        shard_stock = StockShard.objects.filter(product_id=self.id).aggregate(total=models.Sum("stock"))["total"]
+        return self.stock + (shard_stock or 0)
+
+# --------------------------------------
+# STOCK SHARD
+# --------------------------------------
+class StockShard(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="shards")
+    shard = models.PositiveSmallIntegerField()
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["product", "shard"], name="unique_stock_shard")]
+
+    def __str__(self):
+        return f"{self.product_id}#{self.shard}: {self.stock}"
+
 # --------------------------------------
 # COLLECTION
 # --------------------------------------
@@ -85,6 +131,12 @@ class Appointment(models.Model):
     notes = models.TextField(blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Owner-scoped lists ordered by date, with the keyset's pk tiebreaker
+            models.Index(fields=["user", "-appointment_date", "-id"]),
+        ]
+
     def __str__(self):
         return f"Appointment with {self.designer.name} on {self.appointment_date}"
 
@@ -112,6 +164,26 @@ class CartItem(models.Model):
     def __str__(self):
         return f"{self.quantity} x {self.product.name if self.product else 'Deleted Product'}"
 
+# --------------------------------------
+# STOCK RESERVATION
+# --------------------------------------
+class StockReservation(models.Model):
+    """Stock held for a cart line until `expires_at`; see services.update_cart."""
+    cart_item = models.OneToOneField(CartItem, on_delete=models.CASCADE, related_name="reservation")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reservations")
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Active holds per product (services.reserved_stock) and the expiry sweep
+            models.Index(fields=["product", "expires_at"]),
+            models.Index(fields=["expires_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} until {self.expires_at:%Y-%m-%d %H:%M}"
+
 # --------------------------------------
 # ORDER
 # --------------------------------------
@@ -129,6 +201,13 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending", db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["-created_at"]),
+            # Owner-scoped lists ordered by date, with the keyset's pk tiebreaker
+            models.Index(fields=["user", "-created_at", "-id"]),
+        ]
+
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"
 
@@ -144,6 +223,22 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.quantity} x {self.product.name if self.product else 'Deleted Product'}"
 
+# --------------------------------------
+# ORDER CATEGORY (denormalized order -> category link, see bridal_api.services)
+# --------------------------------------
+class OrderCategory(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="category_links")
+    # Covered by the (category, order) constraint below
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="order_links", db_index=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["category", "order"], name="unique_order_category"),
+        ]
+
+    def __str__(self):
+        return f"Order {self.order_id} in category {self.category_id}"
+
 # --------------------------------------
 # REVIEW
 # --------------------------------------
@@ -173,14 +268,51 @@ class Payment(models.Model):
         return f"{self.user} - {self.amount} ({self.status})"
 
 
+# --------------------------------------
+# IDEMPOTENCY KEY (stored responses, see bridal_api.idempotency)
+# --------------------------------------
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="idempotency_keys")
+    scope = models.CharField(max_length=50)  # orders.create, payments.initiate
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)  # None while in flight
+    response_body = models.BinaryField(null=True, blank=True)  # zlib-compressed JSON
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "scope", "key"], name="unique_idempotency_key")]
+
+    def __str__(self):
+        return f"{self.scope}:{self.key}"
+
+
+# --------------------------------------
+# SEARCH TOKEN (portable full-text index, see bridal_api.search)
+# --------------------------------------
+class SearchToken(models.Model):
+    kind = models.CharField(max_length=20)  # product, collection, designer
+    object_id = models.PositiveBigIntegerField()
+    token = models.CharField(max_length=64)
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["kind", "token"]),
+            models.Index(fields=["kind", "object_id"]),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} {self.token}"
+
+
 # --------------------------------------
 # SIGNAL: Update product stock on order item creation
 # --------------------------------------
+# Orders placed through bridal_api.services lock and decrement stock in bulk
+# and insert their items with bulk_create, which does not fire this signal.
 @receiver(post_save, sender=OrderItem)
 def update_stock(sender, instance, created, **kwargs):
-    if created and instance.product:
-        if instance.product.stock >= instance.quantity:
-            instance.product.stock -= instance.quantity
-            instance.product.save()
-        else:
-            raise ValueError(f"Not enough stock for product {instance.product.name}")
+    if created and instance.product_id:
+        from .services import take_stock
+        take_stock({instance.product_id: instance.product}, {instance.product_id: instance.quantity})
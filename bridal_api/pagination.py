@@ -1,7 +1,258 @@
 # bridal_api/pagination.py
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .counts import estimate_count
+
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 10                 # Default items per page
     page_size_query_param = 'page_size'  # Allow client to override
     max_page_size = 100            # Maximum items per page
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator whose count is exact up to `exact_count_limit` rows and estimated beyond."""
+    def __init__(self, object_list, per_page, exact_count_limit, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.exact_count_limit = exact_count_limit
+        self.count_approximate = False
+
+    @property
+    def count(self):
+        if not hasattr(self, '_count'):
+            self._count, self.count_approximate = estimate_count(self.object_list, self.exact_count_limit)
+        return self._count
+
+
+class EstimatedCountPagination(StandardResultsSetPagination):
+    """
+    Numbered pages without an unbounded COUNT(*) on big tables. The count
+    is flagged with count_approximate when it comes from a table counter,
+    the planner or a cached count rather than an exact LIMITed count.
+    """
+    exact_count_limit = getattr(settings, 'PAGINATION_EXACT_COUNT_LIMIT', 10000)
+
+    def django_paginator_class(self, queryset, page_size):
+        return EstimatedCountPaginator(queryset, page_size, self.exact_count_limit)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('count_approximate', self.page.paginator.count_approximate),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_approximate'] = {'type': 'boolean', 'example': False}
+        return response_schema
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination on the view's first ordering field plus a
+    primary key tiebreaker. Cursors are opaque and pages are fetched with a
+    WHERE on the last seen position, so there is no COUNT(*) and no OFFSET.
+    NULLs sort as the smallest value in both directions.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = '-created_at'       # Used when the view declares no ordering
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.field_name = self.ordering.lstrip('-')
+        try:
+            self.nullable = queryset.model._meta.get_field(self.field_name).null
+        except FieldDoesNotExist:
+            self.nullable = True   # Annotations such as rating_average
+        descending = self.ordering.startswith('-')
+
+        cursor = self.decode_cursor(request)
+        self.reverse = bool(cursor and cursor['r'])
+        backwards = descending != self.reverse
+        if cursor is not None:
+            queryset = queryset.filter(self.after(cursor['v'], cursor['i'], backwards))
+        if backwards:
+            order = [F(self.field_name).desc(nulls_last=True), '-pk']
+        else:
+            order = [F(self.field_name).asc(nulls_first=True), 'pk']
+
+        rows = list(queryset.order_by(*order)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+
+        # Coming from another page implies there is one on the other side
+        self.has_next = has_more if not self.reverse else cursor is not None
+        self.has_previous = has_more if self.reverse else cursor is not None
+        return self.page
+
+    def after(self, value, pk, backwards):
+        """Rows strictly after (value, pk) in the given direction."""
+        field = self.field_name
+        if backwards:
+            if value is None:
+                return Q(**{f'{field}__isnull': True, 'pk__lt': pk})
+            condition = Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk})
+            if self.nullable:
+                condition |= Q(**{f'{field}__isnull': True})
+            return condition
+        if value is None:
+            return Q(**{f'{field}__isnull': True, 'pk__gt': pk}) | Q(**{f'{field}__isnull': False})
+        return Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+
+    def get_ordering(self, request, queryset, view):
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                if ordering:
+                    return ordering[0]
+        ordering = getattr(view, 'ordering', None) or self.ordering
+        return ordering if isinstance(ordering, str) else ordering[0]
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    # -------------------- CURSORS --------------------
+    def position(self, item):
+        if isinstance(item, dict):
+            return item[self.field_name], item.get('pk', item.get('id'))
+        return getattr(item, self.field_name), item.pk
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            if cursor['o'] != self.ordering:
+                raise ValueError
+            return cursor
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, item, reverse):
+        value, pk = self.position(item)
+        if value is not None and not isinstance(value, (int, float, bool)):
+            value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        payload = json.dumps({'o': self.ordering, 'v': value, 'i': pk, 'r': reverse}, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class KeysetOrPagePagination(BasePagination):
+    """
+    Keyset pagination by default; classic numbered pages (with a count) when
+    the client asks for ?page=, which admin UIs still rely on. Ranked search
+    results also use numbered pages, since relevance is not a column a
+    keyset can seek on.
+    """
+    keyset_class = KeysetPagination
+    page_class = EstimatedCountPagination
+
+    def get_delegate(self, request, view=None):
+        page = self.page_class()
+        if page.page_query_param in request.query_params or request.query_params.get(api_settings.SEARCH_PARAM):
+            return page
+        return self.keyset_class()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.delegate = self.get_delegate(request, view)
+        return self.delegate.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.delegate.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.keyset_class().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        parameters = self.keyset_class().get_schema_operation_parameters(view)
+        names = {parameter['name'] for parameter in parameters}
+        return parameters + [
+            parameter for parameter in self.page_class().get_schema_operation_parameters(view)
+            if parameter['name'] not in names
+        ]
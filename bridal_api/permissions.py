@@ -26,16 +26,51 @@ class IsAdminOrDesigner(permissions.BasePermission):
 
 class IsOwnerOrAdmin(permissions.BasePermission):
     """
-    Object-level permission: allow owner (obj.user) or admin staff to modify.
-    Read allowed for authenticated users.
-    Assumes target model has a `user` (FK to User) attribute
+    Object-level permission: allow owner or admin staff to modify.
+    Read allowed for authenticated users; pair with OwnerScopedMixin so
+    other users' rows are never found in the first place.
+    Compares `user_id`, so no User row is loaded per check. Rows owned
+    through a parent (cart items, order items) are read-only to their owners
+    unless the view sets `owner_may_write = True`.
     """
     def has_permission(self, request, view):
         # require authentication for any access (you could relax GET to allow anonymous if desired)
-        return bool(request.user and request.user.is_authenticated)
+        if not (request.user and request.user.is_authenticated):
+            return False
+        if request.method in permissions.SAFE_METHODS or request.user.is_staff:
+            return True
+        return "__" not in getattr(view, "owner_field", "") or getattr(view, "owner_may_write", False)
 
     def has_object_permission(self, request, view, obj):
-        if request.method in permissions.SAFE_METHODS:
+        if request.method in permissions.SAFE_METHODS or request.user.is_staff:
             return True
-        # owner or admin
-        return (hasattr(obj, "user") and obj.user == request.user) or request.user.is_staff
+        if hasattr(obj, "user_id"):
+            return obj.user_id == request.user.pk
+        return isinstance(view, OwnerScopedMixin) and getattr(view, "owner_may_write", False)
+
+
+class OwnerScopedMixin:
+    """
+    ViewSet mixin that limits the queryset to rows the requesting user owns,
+    so lists and lookups are filtered by the database. Staff see everything.
+    `owner_field` is the lookup from the model to its owning user.
+    """
+    owner_field = "user"
+    owner_may_write = False  # For rows owned through a parent; see IsOwnerOrAdmin
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if getattr(self, "swagger_fake_view", False) or user.is_staff:
+            return queryset
+        if not user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(**{self.owner_field: user.pk})
+
+    def perform_create(self, serializer):
+        if "__" in self.owner_field:
+            # Owned through a parent row (cart__user, order__user)
+            return super().perform_create(serializer)
+        # Staff may name another owner where the serializer accepts one
+        owner = serializer.validated_data.get(self.owner_field) if self.request.user.is_staff else None
+        serializer.save(**{self.owner_field: owner or self.request.user})
@@ -0,0 +1,160 @@
+# bridal_api/prefetch.py
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+def _relation(model, source):
+    """Return the relation field behind a serializer source, or None for plain columns/properties."""
+    try:
+        field = model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return None
+    return field if field.is_relation else None
+
+
+def _nested(field):
+    """Return (child serializer, is nested serializer) for a serializer field."""
+    if isinstance(field, serializers.ListSerializer):
+        return field.child, True
+    if isinstance(field, serializers.BaseSerializer):
+        return field, True
+    if isinstance(field, serializers.ManyRelatedField):
+        return field.child_relation, False
+    return field, False
+
+
+def _all_columns(model):
+    return [field.name for field in model._meta.concrete_fields]
+
+
+def columns(serializer, model):
+    """
+    Model fields a sparse (?fields=) serializer reads, for .only(). None when
+    the serializer renders every field or reads something that is not a
+    plain model field (a property, a method field, a dotted source).
+    """
+    fields = serializer.fields  # Builds the fields, reading ?fields= on a top-level serializer
+    if getattr(serializer, "requested_fields", None) is None:
+        return None
+    names = [model._meta.pk.name]
+    for field in fields.values():
+        if field.write_only:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        if model_field.concrete and not model_field.many_to_many and model_field.name not in names:
+            names.append(model_field.name)
+    return names
+
+
+def plan(serializer, model):
+    """
+    Walk the readable fields of a serializer and return (select_related, prefetch_related, only)
+    lookups needed to render `model` instances without extra queries. `only` is None unless
+    the serializer was narrowed with ?fields=.
+    """
+    select, prefetch = [], []
+    only = columns(serializer, model)
+    for field in serializer.fields.values():
+        if field.write_only or field.source == "*" or "." in field.source:
+            continue
+        relation = _relation(model, field.source)
+        if relation is None or field.source != relation.name:
+            # Not a relation, or a raw FK column such as "product_id"
+            continue
+        child, is_serializer = _nested(field)
+        if not is_serializer:
+            # Single primary keys are read from the local column; other related fields need the row
+            if isinstance(child, serializers.PrimaryKeyRelatedField) and not (relation.many_to_many or relation.one_to_many):
+                continue
+            if relation.many_to_many or relation.one_to_many:
+                prefetch.append(field.source)
+            else:
+                select.append(field.source)
+                if only is not None:
+                    only.extend(f"{field.source}__{name}" for name in _all_columns(relation.related_model))
+            continue
+
+        related_model = relation.related_model
+        if relation.many_to_many or relation.one_to_many:
+            # Reverse FK prefetches match rows on the FK, so it must stay loaded
+            keep = [relation.field.name] if relation.one_to_many else []
+            queryset = plan_queryset(related_model._default_manager.all(), child, keep=keep)
+            prefetch.append(Prefetch(field.source, queryset=queryset))
+            continue
+
+        # Forward FK / one-to-one: join it and hoist the child's own lookups behind it
+        child_select, child_prefetch, child_only = plan(child, related_model)
+        select.append(field.source)
+        select.extend(f"{field.source}__{lookup}" for lookup in child_select)
+        for lookup in child_prefetch:
+            if isinstance(lookup, Prefetch):
+                prefetch.append(Prefetch(f"{field.source}__{lookup.prefetch_through}", queryset=lookup.queryset))
+            else:
+                prefetch.append(f"{field.source}__{lookup}")
+        if only is not None:
+            if child_only is None and child_select:
+                only = None  # Loading the whole nested tree; don't narrow this level either
+            else:
+                only.extend(f"{field.source}__{name}" for name in child_only or _all_columns(related_model))
+    return select, prefetch, only
+
+
+def _apply(queryset, select, prefetch):
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def plan_queryset(queryset, serializer, keep=()):
+    """Apply the select_related/prefetch_related/only plan for `serializer` to `queryset`."""
+    select, prefetch, only = plan(serializer, queryset.model)
+    queryset = _apply(queryset, select, prefetch)
+    if only is not None:
+        queryset = queryset.only(*only, *keep)
+    return queryset
+
+
+def ordering_columns(queryset, view=None):
+    """Model fields the queryset (or paginator) orders by; they must stay loaded under .only()."""
+    ordering = list(queryset.query.order_by) + list(getattr(view, "ordering", None) or [])
+    ordering += list(queryset.model._meta.ordering)
+    names = []
+    for name in ordering:
+        if not isinstance(name, str):
+            continue
+        name = name.lstrip("-")
+        try:
+            field = queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue  # "pk", "?", annotations and lookups across relations
+        if field.concrete and not field.many_to_many:
+            names.append(field.name)
+    return names
+
+
+class PrefetchMixin:
+    """
+    ViewSet mixin that derives select_related/prefetch_related from the
+    serializer's nested fields, so list pages run a fixed number of queries.
+    Reads narrowed with ?fields= also load only the columns they render.
+    """
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        select, prefetch, only = plan(self.get_serializer(), queryset.model)
+        request = getattr(self, "request", None)
+        self.only_fields = only if request is not None and request.method in SAFE_METHODS else None
+        return _apply(queryset, select, prefetch)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if getattr(self, "only_fields", None):
+            # Applied after filtering so the ordering (and the keyset cursor) columns are known
+            queryset = queryset.only(*self.only_fields, *ordering_columns(queryset, self))
+        return queryset
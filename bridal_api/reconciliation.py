@@ -0,0 +1,61 @@
+# bridal_api/reconciliation.py
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.utils import timezone
+
+from . import gateway, services
+from .models import Payment
+
+
+def settled_status(result):
+    """Payment.status for a transaction/verify answer, or None while the payment is still open."""
+    if services.payment_succeeded(result):
+        return "successful"
+    return services.PAYMENT_STATUSES.get(str((result.get("data") or {}).get("status") or "").lower())
+
+
+def _verify(client, reference):
+    try:
+        return client.verify(reference)
+    except gateway.GatewayError:
+        return None
+
+
+def reconcile_payments(batch_size=200, workers=8, min_age=timedelta(minutes=10),
+                       abandon_after=timedelta(days=1), client=None):
+    """
+    Ask the gateway about Pending payments older than `min_age`, at most
+    `workers` calls at a time, walking them in pk order `batch_size` rows
+    at a time. Each batch's outcomes are written with one UPDATE per status.
+    Payments still open (or unknown to the gateway) after `abandon_after`
+    are marked Failed. Stops early once the circuit breaker opens. Returns
+    counts of checked, updated and unreachable payments.
+    """
+    client = client or gateway.get_client()
+    now = timezone.now()
+    pending = Payment.objects.filter(status="Pending", created_at__lte=now - min_age).order_by("pk")
+    stats = {"checked": 0, "updated": 0, "unreachable": 0}
+    last_pk = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(pending.filter(pk__gt=last_pk).values_list("pk", "reference", "created_at")[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            results = pool.map(lambda row: _verify(client, row[1]), batch)
+            statuses = {}
+            for (_, reference, created_at), result in zip(batch, results):
+                stats["checked"] += 1
+                if result is None:
+                    stats["unreachable"] += 1
+                    continue
+                status = settled_status(result)
+                if status is None and created_at <= now - abandon_after:
+                    status = "Failed"
+                if status:
+                    statuses[reference] = status
+            stats["updated"] += services.apply_payment_statuses(statuses)
+            if client.breaker.is_open:
+                break
+    return stats
@@ -0,0 +1,123 @@
+# bridal_api/renderers.py
+import csv
+import datetime
+import decimal
+import json
+import uuid
+
+from django.conf import settings
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up; the stdlib json path is used instead
+    orjson = None
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer backed by orjson when it is installed. Datetimes and UUIDs
+    (e.g. Payment.reference) are encoded natively; anything orjson does not
+    know, such as Decimal or lazy strings, goes through DRF's own encoder, so
+    the output matches JSONRenderer. Indented output (the browsable API) and
+    installs without orjson use the stdlib renderer.
+    """
+    options = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=encoders.JSONEncoder().default, option=self.options)
+
+
+class FastJSONParser(parsers.JSONParser):
+    """JSONParser backed by orjson for UTF-8 bodies, the stdlib parser otherwise."""
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+# -------------------- EXPORT RENDERERS --------------------
+def export_value(value):
+    """Plain JSON/CSV value for a database value; Decimals stay exact as strings."""
+    if isinstance(value, decimal.Decimal):
+        return f"{value:f}"
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+        return value[:-6] + "Z" if value.endswith("+00:00") else value
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+class _Echo:
+    """File-like object whose write() hands the line back, for csv.writer."""
+    def write(self, value):
+        return value
+
+
+class StreamingRenderer(renderers.BaseRenderer):
+    """
+    Renderer for exports. stream() turns (header, row iterator) into byte
+    chunks for a StreamingHttpResponse; render() handles ordinary responses
+    such as errors.
+    """
+    charset = "utf-8"
+
+    def stream(self, header, rows, chunk_size=1000):
+        yield from self.start(header)
+        chunk = []
+        for row in rows:
+            chunk.append(self.line(header, row))
+            if len(chunk) >= chunk_size:
+                yield "".join(chunk).encode(self.charset)
+                chunk = []
+        if chunk:
+            yield "".join(chunk).encode(self.charset)
+
+    def start(self, header):
+        return ()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        header = list(rows[0]) if rows and isinstance(rows[0], dict) else ["detail"]
+        rows = [[row.get(key) for key in header] if isinstance(row, dict) else [row] for row in rows]
+        return b"".join(self.stream(header, rows))
+
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+    def line(self, header, row):
+        values = {key: export_value(value) for key, value in zip(header, row)}
+        if orjson is not None:
+            return orjson.dumps(values, default=str).decode(self.charset) + "\n"
+        return json.dumps(values, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+
+
+class CSVRenderer(StreamingRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+    def __init__(self):
+        self.writer = csv.writer(_Echo())
+
+    def start(self, header):
+        yield self.writer.writerow(header).encode(self.charset)
+
+    def line(self, header, row):
+        return self.writer.writerow(["" if value is None else export_value(value) for value in row])
@@ -0,0 +1,208 @@
+# bridal_api/search.py
+import re
+import unicodedata
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, IntegerField, Sum, When
+from rest_framework import filters
+
+from .models import Product, Collection, Designer, SearchToken
+
+# kind -> (model, weighted "name" column, "body" column)
+SEARCH_MODELS = {
+    "product": (Product, "name", "description"),
+    "collection": (Collection, "name", "description"),
+    "designer": (Designer, "name", "bio"),
+}
+NAME_WEIGHT = 3
+BODY_WEIGHT = 1
+MAX_TOKEN_LENGTH = 64
+
+_word = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    """Lower-case, accent-stripped word tokens, matching SQLite's unicode61 tokenizer."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return [token[:MAX_TOKEN_LENGTH] for token in _word.findall(text)]
+
+
+def kind_for(model):
+    for kind, (search_model, _, _) in SEARCH_MODELS.items():
+        if issubclass(model, search_model):
+            return kind
+    return None
+
+
+# -------------------- INDEX BACKENDS --------------------
+class TokenIndex:
+    """Inverted index stored in SearchToken; works on any database."""
+
+    def index(self, kind, pk, name, body):
+        self.index_many(kind, [(pk, name, body)])
+
+    def index_many(self, kind, rows):
+        """Index (pk, name, body) rows with one DELETE and one bulk INSERT."""
+        tokens = []
+        for pk, name, body in rows:
+            weights = Counter()
+            for token in tokenize(name):
+                weights[token] += NAME_WEIGHT
+            for token in tokenize(body):
+                weights[token] += BODY_WEIGHT
+            tokens.extend(
+                SearchToken(kind=kind, object_id=pk, token=token, weight=weight)
+                for token, weight in weights.items()
+            )
+        with transaction.atomic():
+            SearchToken.objects.filter(kind=kind, object_id__in=[row[0] for row in rows]).delete()
+            SearchToken.objects.bulk_create(tokens)
+
+    def remove(self, kind, pk):
+        SearchToken.objects.filter(kind=kind, object_id=pk).delete()
+
+    def clear(self, kind):
+        SearchToken.objects.filter(kind=kind).delete()
+
+    def search(self, kind, terms, limit):
+        """Ids of objects containing every term, best score first."""
+        terms = set(terms)
+        return list(
+            SearchToken.objects.filter(kind=kind, token__in=terms)
+            .values("object_id")
+            .annotate(matched=Count("token", distinct=True), score=Sum("weight"))
+            .filter(matched=len(terms))
+            .order_by("-score", "object_id")
+            .values_list("object_id", flat=True)[:limit]
+        )
+
+
+class Fts5Index:
+    """SQLite FTS5 tables created by migration 0017, one per kind, keyed by rowid = pk."""
+
+    def table(self, kind):
+        return f"bridal_api_fts_{kind}"
+
+    def index(self, kind, pk, name, body):
+        self.index_many(kind, [(pk, name, body)])
+
+    def index_many(self, kind, rows):
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table(kind)} WHERE rowid = %s", [[pk] for pk, _, _ in rows])
+            cursor.executemany(
+                f"INSERT INTO {self.table(kind)} (rowid, name, body) VALUES (%s, %s, %s)",
+                [[pk, name or "", body or ""] for pk, name, body in rows],
+            )
+
+    def remove(self, kind, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table(kind)} WHERE rowid = %s", [pk])
+
+    def clear(self, kind):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table(kind)}")
+
+    def search(self, kind, terms, limit):
+        match = " ".join('"%s"' % term.replace('"', '""') for term in terms)
+        table = self.table(kind)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {table} WHERE {table} MATCH %s "
+                f"ORDER BY bm25({table}, {NAME_WEIGHT}.0, {BODY_WEIGHT}.0), rowid LIMIT %s",
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+_fts5_available = {}
+
+
+def get_index():
+    """FTS5 when running on SQLite with the virtual tables present, SearchToken otherwise."""
+    if connection.vendor != "sqlite":
+        return TokenIndex()
+    name = connection.settings_dict["NAME"]
+    if name not in _fts5_available:
+        _fts5_available[name] = "bridal_api_fts_product" in connection.introspection.table_names()
+    return Fts5Index() if _fts5_available[name] else TokenIndex()
+
+
+def index_instance(instance):
+    kind = kind_for(type(instance))
+    if kind is None:
+        return
+    _, name_field, body_field = SEARCH_MODELS[kind]
+    get_index().index(kind, instance.pk, getattr(instance, name_field), getattr(instance, body_field))
+
+
+def index_objects(objects):
+    """Index a batch of saved instances of one model, e.g. after bulk_create."""
+    objects = list(objects)
+    if not objects:
+        return
+    kind = kind_for(type(objects[0]))
+    _, name_field, body_field = SEARCH_MODELS[kind]
+    get_index().index_many(kind, [
+        (obj.pk, getattr(obj, name_field), getattr(obj, body_field)) for obj in objects
+    ])
+
+
+def remove_instance(instance):
+    kind = kind_for(type(instance))
+    if kind is not None:
+        get_index().remove(kind, instance.pk)
+
+
+def rebuild(kind, batch_size=1000):
+    """Re-index every row of `kind`; returns the number of rows indexed."""
+    model, name_field, body_field = SEARCH_MODELS[kind]
+    index = get_index()
+    count = 0
+    with transaction.atomic():
+        index.clear(kind)
+        rows = model.objects.order_by("pk").values_list("pk", name_field, body_field)
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                index.index_many(kind, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            index.index_many(kind, batch)
+            count += len(batch)
+    return count
+
+
+# -------------------- FILTER BACKEND --------------------
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    Drop-in replacement for SearchFilter on indexed models. Matches whole
+    words against the search index and orders by relevance, unless the
+    client asked for an explicit ?ordering=. Unindexed models fall back to
+    SearchFilter's icontains lookups.
+
+    Only the SEARCH_MAX_RESULTS best matches are returned, so a search never
+    pages or counts past that many results; narrow the terms to go further.
+    """
+    @property
+    def max_results(self):
+        return getattr(settings, "SEARCH_MAX_RESULTS", 1000)
+
+    def filter_queryset(self, request, queryset, view):
+        kind = kind_for(queryset.model)
+        if kind is None:
+            return super().filter_queryset(request, queryset, view)
+        terms = tokenize(" ".join(self.get_search_terms(request)))
+        if not terms:
+            return queryset
+
+        ids = get_index().search(kind, terms, self.max_results)
+        queryset = queryset.filter(pk__in=ids)
+        if filters.OrderingFilter.ordering_param in request.query_params or not ids:
+            return queryset
+        rank = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)], output_field=IntegerField())
+        return queryset.annotate(search_rank=rank).order_by("search_rank")
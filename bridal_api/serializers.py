@@ -1,13 +1,76 @@
 from django.contrib.auth import authenticate
+from django.db import transaction
 from .models import User
 from rest_framework import serializers
+from . import services
 from .models import (
     User, Category, Product, Collection, Designer, Appointment,
-    Cart, CartItem, Order, OrderItem, Review
+    Cart, CartItem, Order, OrderItem, Review, StockShard
 )
 
+# -------------------- SPARSE FIELDS & EXPANSION --------------------
+def parse_field_tree(values):
+    """Turn ['id,collections.name'] into {'id': {}, 'collections': {'name': {}}}."""
+    tree = {}
+    for value in values:
+        for path in value.split(','):
+            node = tree
+            for part in filter(None, (part.strip() for part in path.split('.'))):
+                node = node.setdefault(part, {})
+    return tree
+
+
+class DynamicFieldsMixin:
+    """
+    ModelSerializer mixin for ?fields= and ?expand=.
+
+    ?fields=id,name,collections.name keeps only the listed readable fields
+    (write-only fields always stay). Relations named in Meta.expandable_fields
+    render as ids unless listed in ?expand=; dotted paths such as
+    ?expand=collections.products are handed down to the nested serializers.
+    The query string is read by the top-level serializer only.
+    """
+    def __init__(self, *args, **kwargs):
+        fields, expand = kwargs.pop('fields', None), kwargs.pop('expand', None)
+        self.requested_fields = parse_field_tree(fields) if isinstance(fields, (list, tuple)) else fields
+        self.requested_expand = parse_field_tree(expand) if isinstance(expand, (list, tuple)) else expand
+        super().__init__(*args, **kwargs)
+
+    def is_root(self):
+        parent = self.parent
+        return parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None)
+
+    def get_requested(self):
+        if self.requested_fields is None and self.requested_expand is None and self.is_root():
+            request = self.context.get('request')
+            if request is not None:
+                self.requested_fields = parse_field_tree(request.query_params.getlist('fields')) or None
+                self.requested_expand = parse_field_tree(request.query_params.getlist('expand'))
+        return self.requested_fields, self.requested_expand or {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested, expand = self.get_requested()
+
+        for name, (serializer_class, options) in getattr(self.Meta, 'expandable_fields', {}).items():
+            if name in expand and name in fields:
+                fields[name] = serializer_class(
+                    read_only=True, fields=(requested or {}).get(name) or None, expand=expand[name], **options
+                )
+        if requested is not None:
+            for name in [name for name, field in fields.items() if name not in requested and not field.write_only]:
+                del fields[name]
+
+        # Declared nested serializers (e.g. order items) take the dotted remainder
+        for name, field in fields.items():
+            child = field.child if isinstance(field, serializers.ListSerializer) else field
+            if isinstance(child, DynamicFieldsMixin) and child.requested_expand is None:
+                child.requested_fields = (requested or {}).get(name) or None
+                child.requested_expand = expand.get(name, {})
+        return fields
+
 # -------------------- USER --------------------
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """General purpose User serializer for reading user info"""
     class Meta:
         model = User
@@ -69,41 +132,93 @@ class LogoutSerializer(serializers.Serializer):
     # Validation can be handled in the logout view
 
 # -------------------- CATEGORY --------------------
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = "__all__"
         read_only_fields = ['id', 'created_at']
 
 # -------------------- PRODUCT --------------------
-class ProductSerializer(serializers.ModelSerializer):
+class StockField(serializers.IntegerField):
+    """Writes Product.stock; reads Product.stock_on_hand, which counts stock shards."""
+    def get_attribute(self, instance):
+        return instance.stock_on_hand
+
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    stock = StockField(min_value=0, required=False)
+    rating_average = serializers.SerializerMethodField()
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price', 'stock', 'category', 'created_at']
-        read_only_fields = ['id', 'created_at']
+        fields = [
+            'id', 'sku', 'name', 'description', 'price', 'stock', 'stock_shards', 'category', 'created_at',
+            'rating_count', 'rating_average', 'rating_histogram',
+        ]
+        read_only_fields = ['id', 'created_at', 'rating_count', 'stock_shards']
+        # Columns read by the computed fields, for bridal_api.fastpath
+        computed_sources = {
+            'stock': ['stock', 'stock_shards', 'shard_stock'],  # shard_stock: ProductViewSet's annotation
+            'rating_average': ['rating_sum', 'rating_count'],
+            'rating_histogram': ['rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5'],
+        }
+
+    def get_rating_average(self, obj):
+        return round(obj.rating_sum / obj.rating_count, 2) if obj.rating_count else None
+
+    def update(self, instance, validated_data):
+        if not instance.stock_shards or 'stock' not in validated_data:
+            return super().update(instance, validated_data)
+        with transaction.atomic():
+            # A written level replaces the whole stock, shards included
+            StockShard.objects.filter(product=instance).update(stock=0)
+            instance.shard_stock = 0
+            return super().update(instance, validated_data)
+
+# -------------------- STOCK ADJUSTMENT --------------------
+class StockAdjustmentSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(min_value=1)
+    delta = serializers.IntegerField(required=False)
+    set = serializers.IntegerField(required=False, min_value=0)
+
+    def validate(self, attrs):
+        if ('delta' in attrs) == ('set' in attrs):
+            raise serializers.ValidationError("Give exactly one of 'delta' or 'set'.")
+        return attrs
+
+class BulkStockSerializer(serializers.Serializer):
+    adjustments = StockAdjustmentSerializer(many=True, allow_empty=False)
+
+    def validate_adjustments(self, value):
+        product_ids = [item['product_id'] for item in value]
+        if len(product_ids) != len(set(product_ids)):
+            raise serializers.ValidationError("Each product may appear only once.")
+        return value
 
 # -------------------- COLLECTION --------------------
-class CollectionSerializer(serializers.ModelSerializer):
-    products = ProductSerializer(many=True, read_only=True)
+class CollectionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    products = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
 
     class Meta:
         model = Collection
         fields = ['id', 'name', 'description', 'products', 'created_at']
+        expandable_fields = {'products': (ProductSerializer, {'many': True})}
         read_only_fields = ['id', 'created_at']
 
 # -------------------- DESIGNER --------------------
-class DesignerSerializer(serializers.ModelSerializer):
-    collections = CollectionSerializer(many=True, read_only=True)
+class DesignerSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    collections = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
 
     class Meta:
         model = Designer
         fields = ['id', 'name', 'bio', 'collections', 'created_at']
+        expandable_fields = {'collections': (CollectionSerializer, {'many': True})}
         read_only_fields = ['id', 'created_at']
 
 # -------------------- APPOINTMENT --------------------
-class AppointmentSerializer(serializers.ModelSerializer):
-    user = UserSerializer(read_only=True)
-    designer = DesignerSerializer(read_only=True)
+class AppointmentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    designer = serializers.PrimaryKeyRelatedField(read_only=True)
     designer_id = serializers.PrimaryKeyRelatedField(
         queryset=Designer.objects.all(), write_only=True, source='designer'
     )
@@ -111,11 +226,12 @@ class AppointmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Appointment
         fields = ['id', 'user', 'designer', 'designer_id', 'appointment_date', 'notes', 'created_at']
+        expandable_fields = {'user': (UserSerializer, {}), 'designer': (DesignerSerializer, {})}
         read_only_fields = ['id', 'created_at', 'user']
 
 # -------------------- CART ITEM --------------------
-class CartItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+class CartItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    product = serializers.PrimaryKeyRelatedField(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all(), write_only=True, source='product'
     )
@@ -123,9 +239,10 @@ class CartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
         fields = ['id', 'product', 'product_id', 'quantity']
+        expandable_fields = {'product': (ProductSerializer, {})}
 
 # -------------------- CART --------------------
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
 
     class Meta:
@@ -133,9 +250,22 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'created_at', 'items']
         read_only_fields = ['id', 'created_at']
 
+class CartLineSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=0)  # 0 removes the product from the cart
+
+class CartBulkSerializer(serializers.Serializer):
+    items = CartLineSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, value):
+        product_ids = [item['product_id'] for item in value]
+        if len(product_ids) != len(set(product_ids)):
+            raise serializers.ValidationError("Each product may appear only once.")
+        return value
+
 # -------------------- ORDER ITEM --------------------
-class OrderItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+class OrderItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    product = serializers.PrimaryKeyRelatedField(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all(), write_only=True, source='product'
     )
@@ -143,42 +273,50 @@ class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = ['id', 'product', 'product_id', 'quantity', 'price']
+        expandable_fields = {'product': (ProductSerializer, {})}
+
+# -------------------- ORDER LINE --------------------
+class OrderLineSerializer(OrderItemSerializer):
+    """
+    Order item as written through OrderSerializer. Product ids are checked in
+    bulk by services.create_order rather than fetched one by one here.
+    """
+    product_id = serializers.IntegerField(min_value=1, write_only=True)
+    quantity = serializers.IntegerField(min_value=1)
+
+    class Meta(OrderItemSerializer.Meta):
+        read_only_fields = ['price']
 
 # -------------------- ORDER --------------------
-class OrderSerializer(serializers.ModelSerializer):
-    items = OrderItemSerializer(many=True)
-    user = UserSerializer(read_only=True)
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    items = OrderLineSerializer(many=True)
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
         model = Order
         fields = ['id', 'user', 'total_price', 'status', 'created_at', 'items']
         read_only_fields = ['id', 'user', 'total_price', 'created_at']
+        expandable_fields = {'user': (UserSerializer, {})}
+
+    def validate_items(self, value):
+        if not value:
+            raise serializers.ValidationError("An order needs at least one item.")
+        return value
 
     def create(self, validated_data):
         items_data = validated_data.pop('items')
-        order = Order.objects.create(**validated_data)
-        total_price = 0
-
-        for item in items_data:
-            product = item['product']
-            quantity = item['quantity']
-
-            if product.stock < quantity:
-                raise serializers.ValidationError(f"Not enough stock for {product.name}")
-
-            product.stock -= quantity
-            product.save()
-
-            price = product.price * quantity
-            OrderItem.objects.create(order=order, product=product, quantity=quantity, price=price)
-            total_price += price
-
-        order.total_price = total_price
-        order.save()
-        return order
+        lines = [(item['product_id'], item['quantity']) for item in items_data]
+        try:
+            return services.create_order(lines=lines, **validated_data)
+        except services.UnknownProduct as exc:
+            raise serializers.ValidationError({"items": [str(exc)]})
+        except services.InsufficientStock as exc:
+            raise serializers.ValidationError(str(exc))
 
 # -------------------- REVIEW --------------------
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    rating = serializers.IntegerField(min_value=1, max_value=5, default=5)
+
     class Meta:
         model = Review
         fields = "__all__"
@@ -0,0 +1,577 @@
+# bridal_api/services.py
+import random
+from collections import Counter, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Case, Count, F, Prefetch, Q, Sum, Value, When, prefetch_related_objects
+from django.utils import timezone
+
+from . import cache, counts, gateway
+from .models import (
+    Cart, CartItem, Order, OrderCategory, OrderItem, Payment, Product, Review, StockReservation, StockShard,
+)
+
+
+class UnknownProduct(ValueError):
+    """Raised when an order line references a product that does not exist."""
+    def __init__(self, product_ids):
+        self.product_ids = sorted(product_ids)
+        super().__init__(f"Unknown product(s): {', '.join(map(str, self.product_ids))}")
+
+
+class EmptyCart(ValueError):
+    """Raised when checking out a cart that has no items."""
+    def __init__(self):
+        super().__init__("The cart is empty.")
+
+
+class InsufficientStock(ValueError):
+    """Raised when a product cannot cover the requested quantity."""
+    def __init__(self, product):
+        self.product = product
+        super().__init__(f"Not enough stock for {product.name}")
+
+
+# -------------------- STOCK --------------------
+class StockConflict(ValueError):
+    """Raised when a bulk stock change cannot be applied; `failures` says why per product."""
+    def __init__(self, failures):
+        self.failures = failures
+        super().__init__("Stock change rejected for %d product(s)" % len(failures))
+
+
+def update_stock_levels(deltas=None, levels=None, floors=None):
+    """
+    Apply relative {product_id: delta} and absolute {product_id: level}
+    changes to Product.stock in a single guarded UPDATE. Rows a delta would
+    take below zero, or below their {product_id: floor} (stock other carts
+    hold), are left untouched; returns True only if every product was updated.
+    """
+    deltas = {pk: delta for pk, delta in (deltas or {}).items() if delta}
+    levels, floors = levels or {}, floors or {}
+    if not deltas and not levels:
+        return True
+    guard = Q()
+    whens = []
+    for pk, delta in deltas.items():
+        guard |= Q(pk=pk, stock__gte=floors.get(pk, 0) - delta) if delta < 0 else Q(pk=pk)
+        whens.append(When(pk=pk, then=F("stock") + delta))
+    for pk, level in levels.items():
+        guard |= Q(pk=pk)
+        whens.append(When(pk=pk, then=Value(level)))
+    updated = Product.objects.filter(guard).update(
+        stock=Case(*whens, default=F("stock"), output_field=models.PositiveIntegerField())
+    )
+    if updated:
+        cache.invalidate(Product)
+    return updated == len(deltas) + len(levels)
+
+
+def apply_stock_deltas(deltas, floors=None):
+    """Apply {product_id: delta} in one guarded UPDATE; see update_stock_levels."""
+    return update_stock_levels(deltas=deltas, floors=floors)
+
+
+@transaction.atomic
+def adjust_stock(deltas=None, levels=None):
+    """
+    Apply bulk stock changes all-or-nothing and return {product_id: stock}.
+    Two queries on success: the guarded UPDATE and a read of the new levels.
+    Raises StockConflict (rolling everything back) if any product is unknown
+    or would go negative.
+
+    On sharded products a level replaces the shards too, a negative delta
+    the product row cannot cover is taken from the shards (see
+    adjust_stock_locked), and the returned stock includes the shards.
+    """
+    deltas, levels = deltas or {}, levels or {}
+    product_ids = set(deltas) | set(levels)
+    with transaction.atomic():
+        applied = update_stock_levels(deltas, levels)
+        if not applied:
+            # Undo the rows that did update so the retry below sees the old levels
+            transaction.set_rollback(True)
+    if not applied:
+        adjust_stock_locked(deltas, levels, product_ids)
+    rows = list(Product.objects.filter(pk__in=product_ids).values_list("pk", "stock", "stock_shards"))
+    stock = {pk: level for pk, level, _ in rows}
+    sharded = [pk for pk, _, shards in rows if shards]
+    if sharded:
+        StockShard.objects.filter(product_id__in=[pk for pk in sharded if pk in levels]).update(stock=0)
+        for pk, total in shard_totals(sharded).items():
+            stock[pk] += total
+    return stock
+
+
+def adjust_stock_locked(deltas, levels, product_ids):
+    """
+    adjust_stock's second attempt once its guarded UPDATE failed. A sharded
+    product's row only holds stock added since sharding, so a negative delta
+    there must reach the shards. Locks the products, checks every change
+    against stock on hand (shards included) and raises StockConflict listing
+    what cannot apply; otherwise applies plain changes with one UPDATE and
+    drains sharded products as orders do.
+    """
+    products = {
+        product.pk: product
+        for product in Product.objects.select_for_update().filter(pk__in=product_ids).order_by("pk")
+    }
+    sharded = [pk for pk, product in products.items() if product.stock_shards]
+    totals = shard_totals(sharded) if sharded else {}
+    on_hand = {pk: product.stock + totals.get(pk, 0) for pk, product in products.items()}
+    failures = [{"product_id": pk, "detail": "Product not found."} for pk in sorted(product_ids - set(products))]
+    failures += [
+        {"product_id": pk, "detail": f"Stock {on_hand[pk]} cannot cover a change of {delta}."}
+        for pk, delta in sorted(deltas.items()) if pk in on_hand and on_hand[pk] + delta < 0
+    ]
+    if failures:
+        raise StockConflict(failures)
+    drain = {pk: -delta for pk, delta in deltas.items() if delta < 0 and pk in totals}
+    update_stock_levels({pk: delta for pk, delta in deltas.items() if pk not in drain}, levels)
+    if drain:
+        drain_shards(products, drain)
+        cache.invalidate(Product)
+
+
+# -------------------- SHARDED STOCK --------------------
+# Products with stock_shards > 0 keep their stock in that many StockShard
+# rows. Orders never lock a sharded product's row: an order decrements one
+# random shard with a guarded UPDATE, so concurrent orders for a hot product
+# mostly touch different rows. Cart holds are guaranteed by shard locks
+# instead: update_cart locks all of a sharded product's shards while it
+# counts and writes holds, and the order recounts holds once its shard
+# UPDATE holds that lock. When the chosen shard cannot cover the line, or
+# the product has holds, drain_shards locks the product and all its shards
+# and takes the quantity exactly. Stock added to Product.stock after
+# sharding (bulk stock deltas) is drained first.
+def shard_totals(product_ids):
+    """{product_id: sum of its shards} for the given products, in one query."""
+    rows = (
+        StockShard.objects.filter(product_id__in=product_ids)
+        .order_by().values("product_id").annotate(total=Sum("stock")).values_list("product_id", "total")
+    )
+    return dict(rows)
+
+
+@transaction.atomic
+def reshard_stock(product_id, shards):
+    """
+    Spread a product's whole stock evenly over `shards` StockShard rows, or
+    fold it back onto Product.stock when `shards` is 0. Returns the product.
+    """
+    product = Product.objects.select_for_update().get(pk=product_id)
+    current = StockShard.objects.select_for_update().filter(product=product)
+    total = product.stock + sum(current.values_list("stock", flat=True))
+    current.delete()
+    if shards:
+        size, extra = divmod(total, shards)
+        StockShard.objects.bulk_create([
+            StockShard(product=product, shard=shard, stock=size + (shard < extra)) for shard in range(shards)
+        ])
+    product.stock, product.stock_shards = (0 if shards else total), shards
+    product.save(update_fields=["stock", "stock_shards"])
+    return product
+
+
+def take_from_shards(products, demand, held=None, exclude=None):
+    """
+    Take {product_id: quantity} from sharded products, trying one random
+    shard each first; holds are then recounted (less those matching
+    `exclude`), since one committed before the shard lock was taken may be
+    missing from `held`. Products with holds need their whole total
+    checked, so they go to drain_shards.
+    """
+    held = held or {}
+    exact = {pk: quantity for pk, quantity in demand.items() if held.get(pk)}
+    quick = {pk: quantity for pk, quantity in demand.items() if not held.get(pk)}
+    if quick:
+        guard = Q()
+        whens = []
+        for pk, quantity in quick.items():
+            guard |= Q(product_id=pk, shard=random.randrange(products[pk].stock_shards), stock__gte=quantity)
+            whens.append(When(product_id=pk, then=F("stock") - quantity))
+        with transaction.atomic():
+            updated = StockShard.objects.filter(guard).update(
+                stock=Case(*whens, default=F("stock"), output_field=models.PositiveIntegerField())
+            )
+            taken = updated == len(quick) and not reserved_stock(quick, exclude)
+            if not taken:
+                transaction.set_rollback(True)
+        if not taken:
+            exact.update(quick)
+    if exact:
+        drain_shards(products, exact, reserved=True, exclude=exclude)
+    cache.invalidate(Product)
+
+
+def drain_shards(products, demand, reserved=False, exclude=None):
+    """
+    Exact path: lock the products and all their shards (products first, as
+    reshard_stock does) and take each quantity from Product.stock, then from
+    the fullest shards. With `reserved`, units held by active reservations
+    (less those matching `exclude`) are counted under those locks and left
+    in place. Raises InsufficientStock if the total falls short.
+    """
+    rows = dict(Product.objects.select_for_update().filter(pk__in=demand).order_by("pk").values_list("pk", "stock"))
+    shards = defaultdict(list)
+    for shard in StockShard.objects.select_for_update().filter(product_id__in=demand).order_by("product_id", "shard"):
+        shards[shard.product_id].append(shard)
+    held = reserved_stock(demand, exclude) if reserved else {}
+    row_deltas, changed = {}, []
+    for pk, quantity in demand.items():
+        if rows[pk] + sum(shard.stock for shard in shards[pk]) - held.get(pk, 0) < quantity:
+            raise InsufficientStock(products[pk])
+        if rows[pk]:
+            row_deltas[pk] = -min(rows[pk], quantity)
+            quantity += row_deltas[pk]
+        for shard in sorted(shards[pk], key=lambda shard: shard.stock, reverse=True):
+            if not quantity:
+                break
+            taken = min(shard.stock, quantity)
+            shard.stock -= taken
+            quantity -= taken
+            changed.append(shard)
+    apply_stock_deltas(row_deltas)
+    StockShard.objects.bulk_update(changed, ["stock"])
+
+
+# -------------------- ORDERS --------------------
+def take_stock(products, demand, held=None, exclude=None):
+    """
+    Take {product_id: quantity} from stock, given the products by id, or
+    raise InsufficientStock. `held` ({product_id: units}) is stock reserved
+    by carts other than the one checking out, which must be left in place;
+    `exclude` matches the reservations it leaves out. Plain products are
+    decremented with one guarded UPDATE, which locks and checks their rows
+    in the same statement; sharded ones go through take_from_shards.
+    """
+    held = held or {}
+    plain = {pk: quantity for pk, quantity in demand.items() if not products[pk].stock_shards}
+    sharded = {pk: quantity for pk, quantity in demand.items() if products[pk].stock_shards}
+    if plain:
+        with transaction.atomic():
+            applied = apply_stock_deltas({pk: -quantity for pk, quantity in plain.items()}, held)
+            if not applied:
+                transaction.set_rollback(True)
+        if not applied:
+            stock = dict(Product.objects.filter(pk__in=plain).values_list("pk", "stock"))
+            short = [pk for pk in sorted(plain) if stock[pk] - held.get(pk, 0) < plain[pk]]
+            raise InsufficientStock(products[short[0]])
+        for pk, quantity in plain.items():
+            products[pk].stock -= quantity
+    if sharded:
+        take_from_shards(products, sharded, held, exclude)
+
+
+@transaction.atomic
+def create_order(user, lines, cart=None, **fields):
+    """
+    Create an order from (product_id, quantity) lines.
+
+    Stock held by cart reservations is left alone, except that checking out
+    `cart` consumes that cart's holds. Plain products are locked (pk order,
+    as update_cart does) before the holds are counted, so a hold committed
+    meanwhile is never missed; sharded ones are read without a lock and
+    their holds recounted under a shard lock (see take_from_shards). Runs a
+    fixed number of queries whatever the basket size: one SELECT FOR UPDATE
+    for the plain products and one SELECT for the rest, one for the holds
+    (plus one DELETE for the cart's on checkout), the guarded stock UPDATEs
+    of take_stock, one INSERT for the order and bulk INSERTs for its items
+    and its OrderCategory links.
+    """
+    lines = [(int(product_id), int(quantity)) for product_id, quantity in lines]
+    demand = Counter()
+    for product_id, quantity in lines:
+        demand[product_id] += quantity
+
+    products = {
+        product.pk: product
+        for product in Product.objects.select_for_update().filter(pk__in=demand, stock_shards=0).order_by("pk")
+    }
+    if len(products) < len(demand):
+        products.update((product.pk, product) for product in Product.objects.filter(pk__in=set(demand) - set(products)))
+    missing = set(demand) - set(products)
+    if missing:
+        raise UnknownProduct(missing)
+    own = Q(cart_item__cart=cart) if cart is not None else None
+    held = reserved_stock(demand, exclude=own)
+    if cart is not None:
+        StockReservation.objects.filter(own, product_id__in=demand).delete()
+    take_stock(products, demand, held, own)
+
+    items = [
+        OrderItem(product=products[product_id], quantity=quantity, price=products[product_id].price * quantity)
+        for product_id, quantity in lines
+    ]
+    total_price = sum((item.price for item in items), Decimal("0"))
+    order = Order.objects.create(user=user, total_price=total_price, **fields)
+    for item in items:
+        item.order = order
+    OrderItem.objects.bulk_create(items)
+    counts.adjust(OrderItem, len(items))  # bulk_create sends no post_save
+    category_ids = {products[product_id].category_id for product_id in demand} - {None}
+    OrderCategory.objects.bulk_create([OrderCategory(order=order, category_id=pk) for pk in sorted(category_ids)])
+
+    prefetch_related_objects([order], Prefetch("items", queryset=OrderItem.objects.select_related("product")))
+    return order
+
+
+# -------------------- CARTS --------------------
+# A cart line holds its quantity in a StockReservation for
+# STOCK_RESERVATION_TTL seconds, refreshed whenever the line is written.
+# Other carts and direct orders see stock minus the active holds; only
+# the cart's own checkout consumes them, and expire_reservations sweeps
+# stale ones.
+def reserved_stock(product_ids, exclude=None):
+    """
+    {product_id: units held by active reservations}, leaving out those
+    matching the `exclude` Q. One query on the (product, expires_at) index.
+    """
+    reservations = StockReservation.objects.filter(product_id__in=product_ids, expires_at__gt=timezone.now())
+    if exclude is not None:
+        reservations = reservations.exclude(exclude)
+    rows = reservations.order_by().values("product_id").annotate(total=Sum("quantity"))
+    return dict(rows.values_list("product_id", "total"))
+
+
+def available_stock(product_ids, exclude=None):
+    """{product_id: stock on hand (shards included) minus active reservations}."""
+    rows = list(Product.objects.filter(pk__in=product_ids).values_list("pk", "stock", "stock_shards"))
+    stock = {pk: level for pk, level, _ in rows}
+    sharded = [pk for pk, _, shards in rows if shards]
+    if sharded:
+        for pk, total in shard_totals(sharded).items():
+            stock[pk] += total
+    held = reserved_stock(stock, exclude)
+    return {pk: level - held.get(pk, 0) for pk, level in stock.items()}
+
+
+def lock_cart(cart):
+    """
+    Lock the cart row. update_cart and checkout_cart take it before any
+    product or item lock, so one cart's writes run one at a time and never
+    take locks in opposite orders.
+    """
+    Cart.objects.select_for_update().values_list("pk", flat=True).get(pk=cart.pk)
+
+
+def conflict_target(*fields):
+    """unique_fields for an upsert; None on MySQL, which upserts on any unique key and rejects a target."""
+    return list(fields) if connection.features.supports_update_conflicts_with_target else None
+
+
+@transaction.atomic
+def update_cart(cart, lines):
+    """
+    Set the quantity of each (product_id, quantity) line in the cart and
+    hold it for STOCK_RESERVATION_TTL seconds; a quantity of 0 removes the
+    line and its hold. Raises InsufficientStock if a product's stock, less
+    other carts' active holds, cannot cover its line. The cart, then the
+    plain products, then the shards of sharded ones are locked while holds
+    are counted, matching the locks create_order takes; the query count does
+    not depend on the batch size.
+    """
+    lock_cart(cart)
+    quantities = {int(product_id): int(quantity) for product_id, quantity in lines}
+    products = {
+        product.pk: product
+        for product in Product.objects.select_for_update().filter(pk__in=quantities, stock_shards=0).order_by("pk")
+    }
+    if len(products) < len(quantities):
+        products.update(
+            (product.pk, product) for product in Product.objects.filter(pk__in=set(quantities) - set(products))
+        )
+    missing = set(quantities) - set(products)
+    if missing:
+        raise UnknownProduct(missing)
+    sharded = [product_id for product_id, product in products.items() if product.stock_shards]
+    if sharded:
+        list(
+            StockShard.objects.select_for_update().filter(product_id__in=sharded)
+            .order_by("product_id", "shard").values_list("pk", flat=True)
+        )
+    wanted = {product_id: quantity for product_id, quantity in sorted(quantities.items()) if quantity}
+    if wanted:
+        available = available_stock(wanted, exclude=Q(cart_item__cart=cart))
+        for product_id, quantity in wanted.items():
+            if available[product_id] < quantity:
+                raise InsufficientStock(products[product_id])
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product_id=product_id, quantity=quantity) for product_id, quantity in wanted.items()],
+            update_conflicts=True, unique_fields=conflict_target("cart", "product"), update_fields=["quantity"],
+        )
+        item_ids = dict(CartItem.objects.filter(cart=cart, product_id__in=wanted).values_list("product_id", "pk"))
+        expires_at = timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+        StockReservation.objects.bulk_create(
+            [
+                StockReservation(
+                    cart_item_id=item_ids[product_id], product_id=product_id, quantity=quantity, expires_at=expires_at,
+                )
+                for product_id, quantity in wanted.items()
+            ],
+            update_conflicts=True, unique_fields=conflict_target("cart_item"), update_fields=["quantity", "expires_at"],
+        )
+    removed = [product_id for product_id, quantity in quantities.items() if not quantity]
+    if removed:
+        CartItem.objects.filter(cart=cart, product_id__in=removed).delete()
+
+
+def expire_reservations(batch_size=1000):
+    """Delete reservations past their expiry in batches; returns how many went."""
+    expired = 0
+    while True:
+        ids = list(
+            StockReservation.objects.filter(expires_at__lte=timezone.now())
+            .order_by("expires_at").values_list("pk", flat=True)[:batch_size]
+        )
+        if not ids:
+            return expired
+        expired += StockReservation.objects.filter(pk__in=ids).delete()[0]
+
+
+@transaction.atomic
+def checkout_cart(cart, **fields):
+    """
+    Turn a cart into an order and empty it. The cart is locked first, so a
+    second checkout of the same cart waits and then finds it empty;
+    create_order consumes the cart's reservations and decrements the
+    products. Adds a fixed number of queries to create_order's, whatever
+    the cart size.
+    """
+    lock_cart(cart)
+    items = CartItem.objects.filter(cart=cart, product__isnull=False)
+    lines = list(items.values_list("product_id", "quantity"))
+    if not lines:
+        raise EmptyCart()
+    order = create_order(cart.user, lines, cart=cart, **fields)
+    CartItem.objects.filter(cart=cart).delete()
+    return order
+
+
+def sync_order_categories(order_ids):
+    """
+    Rebuild the OrderCategory links of the given orders from their items,
+    for item writes that do not go through create_order.
+    """
+    order_ids = set(order_ids)
+    pairs = set(
+        OrderItem.objects.filter(order_id__in=order_ids, product__category__isnull=False)
+        .values_list("order_id", "product__category_id")
+    )
+    with transaction.atomic():
+        OrderCategory.objects.filter(order_id__in=order_ids).delete()
+        OrderCategory.objects.bulk_create([
+            OrderCategory(order_id=order_id, category_id=category_id) for order_id, category_id in sorted(pairs)
+        ])
+
+
+# -------------------- PAYMENTS --------------------
+# Gateway transaction statuses that settle a payment, as Payment.status values
+PAYMENT_STATUSES = {"success": "successful", "failed": "Failed", "cancelled": "Failed"}
+
+
+def checkout_request(payment):
+    """Body of the gateway's transaction/initialize call for `payment`."""
+    return {
+        "amount": str(payment.amount),
+        "currency": "ETB",
+        "tx_ref": str(payment.reference),
+        "callback_url": settings.CHAPA_CALLBACK_URL,
+        "return_url": settings.CHAPA_RETURN_URL,
+        "customization": {"title": "Bridal Dress Payment", "description": "Payment for bridal dress"},
+    }
+
+
+def initiate_payment(user, amount):
+    """
+    Create a pending Payment and return the gateway's answer to initializing
+    it. If the gateway cannot be reached the Payment is marked Failed and
+    the GatewayError propagates.
+    """
+    payment = Payment.objects.create(user=user, amount=amount)
+    try:
+        return gateway.get_client().initialize(checkout_request(payment))
+    except gateway.GatewayError:
+        mark_payment(payment.reference, "Failed")
+        raise
+
+
+def payment_succeeded(result):
+    """Whether a transaction/verify answer reports a completed payment."""
+    return result.get("status") == "success" and (result.get("data") or {}).get("status") == "success"
+
+
+def mark_payment(reference, status):
+    """Set the status of the payment with this reference; False if there is none."""
+    return bool(Payment.objects.filter(reference=reference).update(status=status))
+
+
+def apply_payment_statuses(statuses):
+    """
+    Write {reference: status} to the payments that are still Pending, with
+    one UPDATE per distinct status; returns how many rows changed. Payments
+    settled meanwhile (by a webhook or a user's verification) are left alone.
+    """
+    references = defaultdict(list)
+    for reference, status in statuses.items():
+        references[status].append(reference)
+    return sum(
+        Payment.objects.filter(reference__in=batch, status="Pending").update(status=status)
+        for status, batch in references.items()
+    )
+
+
+# -------------------- REVIEWS --------------------
+RATING_FIELDS = {stars: f"rating_{stars}" for stars in range(1, 6)}
+
+
+def apply_review(product_id, rating, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) one rating from a product's aggregates
+    with a single UPDATE, so concurrent reviews never lose a count. A removal
+    the aggregates cannot cover (they were never counted) is skipped rather
+    than driven below zero; rebuild_review_aggregates repairs such drift.
+    """
+    updates = {
+        "rating_count": F("rating_count") + sign,
+        "rating_sum": F("rating_sum") + sign * rating,
+    }
+    guard = Q()
+    if rating in RATING_FIELDS:
+        updates[RATING_FIELDS[rating]] = F(RATING_FIELDS[rating]) + sign
+        if sign < 0:
+            guard &= Q(**{f"{RATING_FIELDS[rating]}__gt": 0})
+    if sign < 0:
+        guard &= Q(rating_count__gt=0, rating_sum__gte=rating)
+    if Product.objects.filter(guard, pk=product_id).update(**updates):
+        cache.invalidate(Product)
+
+
+@transaction.atomic
+def rebuild_review_aggregates(batch_size=1000):
+    """
+    Recompute every product's review aggregates from Review rows with one
+    grouped query and batched bulk updates. Returns the number of products
+    that have reviews.
+    """
+    count = write_review_aggregates(Product, Review, batch_size)
+    cache.invalidate(Product)
+    return count
+
+
+def write_review_aggregates(product_model, review_model, batch_size=1000):
+    """The rebuild itself, on the given models so migrations can pass historical ones."""
+    fields = ["rating_count", "rating_sum", *RATING_FIELDS.values()]
+    product_model.objects.exclude(rating_count=0).update(**{field: 0 for field in fields})
+
+    rows = review_model.objects.values("product_id").annotate(
+        rating_count=Count("id"),
+        rating_sum=Sum("rating"),
+        **{field: Count("id", filter=Q(rating=stars)) for stars, field in RATING_FIELDS.items()},
+    ).order_by("product_id")
+    products = [product_model(pk=row.pop("product_id"), **row) for row in rows]
+    product_model.objects.bulk_update(products, fields, batch_size=batch_size)
+    return len(products)
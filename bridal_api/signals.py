@@ -1,8 +1,14 @@
 # bridal_api/signals.py
-from django.db.models.signals import post_save, post_delete
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.apps import apps
 from django.conf import settings
+import logging
+
+from . import cache, counts, search, services
+
+logger = logging.getLogger(__name__)
 
 # When an Order is created, try to decrement related Dress stock (if those fields exist).
 @receiver(post_save, sender=apps.get_model('bridal_api', 'Order'))
@@ -51,3 +57,86 @@ def Product_post_delete(sender, instance, **kwargs):
             image_field.delete(save=False)
     except Exception:
         pass
+
+
+# Keep the full-text search index (bridal_api.search) in step with catalog rows
+def search_index_post_save(sender, instance, **kwargs):
+    try:
+        search.index_instance(instance)
+    except Exception:
+        logger.exception("Search indexing failed for %s %s", sender.__name__, instance.pk)
+
+
+def search_index_post_delete(sender, instance, **kwargs):
+    try:
+        search.remove_instance(instance)
+    except Exception:
+        logger.exception("Search index removal failed for %s %s", sender.__name__, instance.pk)
+
+
+for _model_name in ("Product", "Collection", "Designer"):
+    _model = apps.get_model('bridal_api', _model_name)
+    post_save.connect(search_index_post_save, sender=_model, dispatch_uid=f"search_index_save_{_model_name}")
+    post_delete.connect(search_index_post_delete, sender=_model, dispatch_uid=f"search_index_delete_{_model_name}")
+
+
+# Invalidate cached catalog responses (bridal_api.cache) when their rows change
+def catalog_cache_changed(sender, **kwargs):
+    cache.invalidate(sender)
+
+
+def catalog_cache_m2m_changed(sender, instance, action, model, reverse, **kwargs):
+    # Only the side that declares the M2M serializes it (Collection.products, Designer.collections)
+    if action in ("post_add", "post_remove", "post_clear"):
+        cache.invalidate(model if reverse else type(instance))
+
+
+for _model_name in ("Category", "Product", "Collection", "Designer"):
+    _model = apps.get_model('bridal_api', _model_name)
+    post_save.connect(catalog_cache_changed, sender=_model, dispatch_uid=f"catalog_cache_save_{_model_name}")
+    post_delete.connect(catalog_cache_changed, sender=_model, dispatch_uid=f"catalog_cache_delete_{_model_name}")
+
+m2m_changed.connect(
+    catalog_cache_m2m_changed, sender=apps.get_model('bridal_api', 'Collection').products.through,
+    dispatch_uid="catalog_cache_m2m_collection_products",
+)
+m2m_changed.connect(
+    catalog_cache_m2m_changed, sender=apps.get_model('bridal_api', 'Designer').collections.through,
+    dispatch_uid="catalog_cache_m2m_designer_collections",
+)
+
+
+# Row counters behind EstimatedCountPagination (bridal_api.counts)
+def row_count_saved(sender, created, **kwargs):
+    if created:
+        counts.adjust(sender, 1)
+
+
+def row_count_deleted(sender, **kwargs):
+    counts.adjust(sender, -1)
+
+
+for _model_name in ("Order", "OrderItem", "Payment"):
+    _model = apps.get_model('bridal_api', _model_name)
+    post_save.connect(row_count_saved, sender=_model, dispatch_uid=f"row_count_save_{_model_name}")
+    post_delete.connect(row_count_deleted, sender=_model, dispatch_uid=f"row_count_delete_{_model_name}")
+
+
+# Keep OrderCategory links current when items are written one by one (OrderItemViewSet)
+@receiver(post_save, sender=apps.get_model('bridal_api', 'OrderItem'))
+def order_item_categories_changed(sender, instance, **kwargs):
+    services.sync_order_categories([instance.order_id])
+
+
+@receiver(post_delete, sender=apps.get_model('bridal_api', 'OrderItem'))
+def order_item_categories_deleted(sender, instance, origin=None, **kwargs):
+    # Items deleted in a cascade from their order (or its user) take the links with them
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if issubclass(model, sender):
+        services.sync_order_categories([instance.order_id])
+
+
+# Keep Product review aggregates in step when a review is deleted
+@receiver(post_delete, sender=apps.get_model('bridal_api', 'Review'))
+def review_post_delete(sender, instance, **kwargs):
+    services.apply_review(instance.product_id, instance.rating, sign=-1)
@@ -0,0 +1,19 @@
+# bridal_api/tasks.py
+from celery import shared_task
+
+from . import idempotency, reconciliation, services
+
+
+@shared_task
+def reconcile_payments(batch_size=200, workers=8):
+    return reconciliation.reconcile_payments(batch_size=batch_size, workers=workers)
+
+
+@shared_task
+def expire_reservations():
+    return services.expire_reservations()
+
+
+@shared_task
+def purge_idempotency_keys():
+    return idempotency.purge_expired()
@@ -1,3 +1,1520 @@
-from django.test import TestCase
+import csv
+import hashlib
+import hmac
+import importlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import gateway, idempotency, reconciliation, renderers, search, services
+from .importers import ProductImporter
+from .pagination import EstimatedCountPagination
+from .views import OrderItemViewSet, OrderViewSet, ProductViewSet
+from .models import (
+    User, Category, Product, Collection, Designer, Appointment,
+    Cart, CartItem, IdempotencyKey, Order, OrderCategory, OrderItem, Payment, Review, StockReservation, StockShard,
+)
+
+
+class OrderCreationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="bride", email="bride@example.com", password="pass12345")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Gowns")
+        self.products = [
+            Product.objects.create(category=category, name=f"Gown {i}", price=Decimal("100.50"), stock=10)
+            for i in range(20)
+        ]
+
+    def place(self, products, quantity=1):
+        items = [{"product_id": p.id, "quantity": quantity} for p in products]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post("/api/orders/", {"items": items}, format="json")
+        return response, len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_basket(self):
+        small, small_queries = self.place(self.products[:1])
+        large, large_queries = self.place(self.products[1:])
+        self.assertEqual(small.status_code, 201, small.data)
+        self.assertEqual(large.status_code, 201, large.data)
+        self.assertEqual(small_queries, large_queries)
+
+    def test_stock_and_total(self):
+        response, _ = self.place(self.products[:2], quantity=3)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Decimal(response.data["total_price"]), Decimal("603.00"))
+        self.assertEqual(len(response.data["items"]), 2)
+        for product in self.products[:2]:
+            product.refresh_from_db()
+            self.assertEqual(product.stock, 7)
+
+    def test_insufficient_stock_rolls_back(self):
+        response, _ = self.place(self.products[:2], quantity=11)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock, 10)
+
+    def test_unknown_product(self):
+        response = self.client.post("/api/orders/", {"items": [{"product_id": 999, "quantity": 1}]}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("items", response.data)
+
+
+class NestedListQueryTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username="admin", email="admin@example.com", password="pass12345", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        category = Category.objects.create(name="Veils")
+        for i in range(6):
+            products = [Product.objects.create(category=category, name=f"Veil {i}-{j}", price=10, stock=5) for j in range(3)]
+            collection = Collection.objects.create(name=f"Season {i}")
+            collection.products.set(products)
+            designer = Designer.objects.create(name=f"Designer {i}")
+            designer.collections.set([collection])
+            Appointment.objects.create(user=self.admin, designer=designer)
+            customer = User.objects.create_user(username=f"customer{i}", email=f"c{i}@example.com", password="pass12345")
+            cart = Cart.objects.create(user=customer)
+            for product in products:
+                CartItem.objects.create(cart=cart, product=product)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_list_query_count_is_independent_of_page_size(self):
+        urls = [
+            "/api/designers/?", "/api/appointments/?", "/api/carts/?", "/api/collections/?",
+            "/api/designers/?expand=collections.products&", "/api/appointments/?expand=user,designer.collections&",
+            "/api/carts/?expand=items.product&", "/api/designers/?fields=id,collections.name&expand=collections&",
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.count_queries(f"{url}page_size=1"),
+                    self.count_queries(f"{url}page_size=6"),
+                )
+
+    def test_relations_render_as_ids_until_expanded(self):
+        designer = self.client.get("/api/designers/?page_size=1").data["results"][0]
+        self.assertIsInstance(designer["collections"][0], int)
+
+        designer = self.client.get("/api/designers/?page_size=1&expand=collections.products").data["results"][0]
+        self.assertEqual(designer["collections"][0]["name"], "Season 0")
+        self.assertEqual(len(designer["collections"][0]["products"]), 3)
+        self.assertIn("price", designer["collections"][0]["products"][0])
+
+        appointment = self.client.get("/api/appointments/?expand=designer").data["results"][0]
+        self.assertIsInstance(appointment["user"], int)
+        self.assertIsInstance(appointment["designer"]["collections"][0], int)
+
+    def test_sparse_fields_load_only_requested_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/designers/?fields=id,collections.name&expand=collections")
+        designer = response.data["results"][0]
+        self.assertEqual(set(designer), {"id", "collections"})
+        self.assertEqual(set(designer["collections"][0]), {"name"})
+        selects = [q["sql"] for q in ctx.captured_queries if "bridal_api_designer" in q["sql"] and "COUNT(" not in q["sql"]]
+        self.assertNotIn('"bio"', selects[0])
+        collection_sql = next(q["sql"] for q in ctx.captured_queries if 'FROM "bridal_api_collection"' in q["sql"])
+        self.assertNotIn('"description"', collection_sql)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="planner", email="planner@example.com", password="pass12345")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Shoes")
+        for i in range(7):
+            Product.objects.create(category=category, name=f"Shoe {i}", price=Decimal(50 + i % 3), stock=1)
+        designer = Designer.objects.create(name="Vera")
+        for day in [None, 3, 1, None, 2]:
+            date = None if day is None else timezone.now() + timedelta(days=day)
+            Appointment.objects.create(user=self.user, designer=designer, appointment_date=date)
+
+    def walk(self, url):
+        ids, pages = [], []
+        with CaptureQueriesContext(connection) as ctx:
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn("count", response.data)
+                pages.append(response.data)
+                ids.extend(row["id"] for row in response.data["results"])
+                url = response.data["next"]
+        self.assertFalse(any("COUNT(" in q["sql"].upper() or "OFFSET" in q["sql"].upper() for q in ctx.captured_queries))
+        return ids, pages
+
+    def test_forward_and_back_with_ties(self):
+        expected = list(Product.objects.order_by("price", "pk").values_list("pk", flat=True))
+        ids, pages = self.walk("/api/products/?ordering=price&page_size=2")
+        self.assertEqual(ids, expected)
+
+        back = []
+        url = pages[-1]["previous"]
+        while url:
+            response = self.client.get(url)
+            back = [row["id"] for row in response.data["results"]] + back
+            url = response.data["previous"]
+        self.assertEqual(back + [row["id"] for row in pages[-1]["results"]], expected)
+
+    def test_nullable_ordering(self):
+        ids, _ = self.walk("/api/appointments/?page_size=2")
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(len(set(ids)), 5)
+        dated = [a for a in Appointment.objects.filter(pk__in=ids[:3]).order_by("-appointment_date")]
+        self.assertEqual(ids[:3], [a.pk for a in dated])
+
+    def test_page_numbers_still_available(self):
+        response = self.client.get("/api/products/?page=2&page_size=5")
+        self.assertEqual(response.data["count"], 7)
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/api/products/?cursor=nonsense").status_code, 404)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="searcher", email="searcher@example.com", password="pass12345")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Gowns")
+        self.lace_body = Product.objects.create(category=category, name="Aurora", description="Ivory lace sleeves", price=10)
+        self.lace_name = Product.objects.create(category=category, name="Lace Ivory Gown", description="Ball gown", price=20)
+        self.plain = Product.objects.create(category=category, name="Satin Gown", description="Plain satin", price=30)
+
+    def search(self, query):
+        response = self.client.get("/api/products/", {"search": query})
+        self.assertEqual(response.status_code, 200)
+        return [row["id"] for row in response.data["results"]]
+
+    def test_ranked_results(self):
+        self.assertEqual(self.search("ivory lace"), [self.lace_name.pk, self.lace_body.pk])
+        self.assertEqual(self.search("gown"), [self.lace_name.pk, self.plain.pk])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.plain.name = "Satin Mermaid"
+        self.plain.save()
+        self.assertEqual(self.search("mermaid"), [self.plain.pk])
+        self.plain.delete()
+        self.assertEqual(self.search("mermaid"), [])
+
+    def test_token_index_matches_fts(self):
+        for kind in search.SEARCH_MODELS:
+            search.rebuild(kind)
+        fts = search.get_index()
+        tokens = search.TokenIndex()
+        for kind, (model, name_field, body_field) in search.SEARCH_MODELS.items():
+            for obj in model.objects.all():
+                tokens.index(kind, obj.pk, getattr(obj, name_field), getattr(obj, body_field))
+        for query in ["ivory lace", "gown", "satin", "nothing"]:
+            terms = search.tokenize(query)
+            self.assertEqual(tokens.search("product", terms, 10), fts.search("product", terms, 10))
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        caches["catalog"].clear()
+        self.user = User.objects.create_user(username="reader", email="reader@example.com", password="pass12345", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name="Tiaras")
+        self.product = Product.objects.create(category=self.category, name="Crystal Tiara", price=80, stock=4)
+        self.collection = Collection.objects.create(name="Sparkle")
+        self.designer = Designer.objects.create(name="Mira")
+        self.designer.collections.add(self.collection)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_hit_after_miss_without_queries(self):
+        self.assertEqual(self.get("/api/categories/")["X-Cache"], "MISS")
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.get("/api/categories/")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(self.get("/api/categories/?page=1")["X-Cache"], "MISS")
+
+    def test_save_invalidates_dependents_only(self):
+        self.get("/api/designers/")
+        self.get("/api/categories/")
+        self.product.name = "Pearl Tiara"
+        self.product.save()
+        self.assertEqual(self.get("/api/categories/")["X-Cache"], "HIT")
+        self.assertEqual(self.get("/api/designers/")["X-Cache"], "MISS")
+
+    def test_m2m_changes_invalidate(self):
+        self.assertEqual(self.get("/api/collections/?expand=products").data["results"][0]["products"], [])
+        self.product.collections.add(self.collection)
+        response = self.get("/api/collections/?expand=products")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["results"][0]["products"][0]["id"], self.product.pk)
+
+    def test_membership_changes_invalidate_product_filters(self):
+        for url in (f"/api/products/?collection={self.collection.pk}", f"/api/products/?designer={self.designer.pk}"):
+            self.assertEqual(self.get(url).data["results"], [])
+        self.product.collections.add(self.collection)
+        for url in (f"/api/products/?collection={self.collection.pk}", f"/api/products/?designer={self.designer.pk}"):
+            response = self.get(url)
+            self.assertEqual(response["X-Cache"], "MISS")
+            self.assertEqual([row["id"] for row in response.data["results"]], [self.product.pk])
+
+    def test_order_stock_update_invalidates_products(self):
+        url = f"/api/products/{self.product.pk}/"
+        self.get(url)
+        self.client.post("/api/orders/", {"items": [{"product_id": self.product.pk, "quantity": 3}]}, format="json")
+        response = self.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["stock"], 1)
+
+
+class ReviewAggregateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="critic", email="critic@example.com", password="pass12345")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Gloves")
+        self.satin = Product.objects.create(category=category, name="Satin Gloves", price=15)
+        self.lace = Product.objects.create(category=category, name="Lace Gloves", price=25)
+
+    def review(self, product, rating):
+        response = self.client.post("/api/reviews/", {"product": product.pk, "rating": rating}, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_aggregates_follow_reviews(self):
+        self.review(self.satin, 5)
+        self.review(self.satin, 2)
+        self.review(self.lace, 4)
+        self.satin.refresh_from_db()
+        self.assertEqual((self.satin.rating_count, self.satin.rating_sum), (2, 7))
+        self.assertEqual(self.satin.rating_histogram, {"1": 0, "2": 1, "3": 0, "4": 0, "5": 1})
+
+        Review.objects.filter(product=self.satin, rating=2).delete()
+        self.satin.refresh_from_db()
+        self.assertEqual((self.satin.rating_count, self.satin.rating_sum, self.satin.rating_2), (1, 5, 0))
+
+        response = self.client.get("/api/products/?ordering=-rating_average")
+        self.assertEqual([row["id"] for row in response.data["results"]], [self.satin.pk, self.lace.pk])
+        self.assertEqual(response.data["results"][0]["rating_average"], 5.0)
+
+    def test_deleting_uncounted_review_keeps_aggregates_valid(self):
+        Review.objects.create(user=self.user, product=self.satin, rating=4)
+        Product.objects.filter(pk=self.satin.pk).update(rating_count=0, rating_sum=0, rating_4=0)
+        self.user.delete()
+        self.satin.refresh_from_db()
+        self.assertEqual((self.satin.rating_count, self.satin.rating_sum, self.satin.rating_4), (0, 0, 0))
+
+    def test_rating_out_of_range(self):
+        response = self.client.post("/api/reviews/", {"product": self.satin.pk, "rating": 6}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_rebuild(self):
+        Review.objects.create(user=self.user, product=self.lace, rating=3)
+        Review.objects.create(user=self.user, product=self.lace, rating=1)
+        Product.objects.filter(pk=self.satin.pk).update(rating_count=9, rating_sum=9)
+        call_command("rebuild_review_aggregates", stdout=StringIO())
+        self.lace.refresh_from_db()
+        self.satin.refresh_from_db()
+        self.assertEqual((self.lace.rating_count, self.lace.rating_sum, self.lace.rating_1, self.lace.rating_3), (2, 4, 1, 1))
+        self.assertEqual((self.satin.rating_count, self.satin.rating_sum), (0, 0))
+
+
+class ProductFacetTests(TestCase):
+    def setUp(self):
+        caches["catalog"].clear()
+        self.user = User.objects.create_user(username="shopper", email="shopper@example.com", password="pass12345")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        gowns = Category.objects.create(name="Gowns")
+        veils = Category.objects.create(name="Veils")
+        self.spring = Collection.objects.create(name="Spring")
+        summer = Collection.objects.create(name="Summer")
+        for price, category, collections in [
+            (90, veils, [self.spring]),
+            (120, veils, [self.spring, summer]),
+            (800, gowns, [summer]),
+            (3000, gowns, []),
+        ]:
+            product = Product.objects.create(category=category, name=f"Item {price}", price=price)
+            product.collections.set(collections)
+
+    def test_counts(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/products/facets/?page_size=2")
+        self.assertEqual(response.status_code, 200)
+        facets = response.data["facets"]
+        self.assertEqual([(c["name"], c["count"]) for c in facets["category"]], [("Gowns", 2), ("Veils", 2)])
+        self.assertEqual([p["count"] for p in facets["price"]], [1, 1, 0, 1, 0, 1])
+        self.assertEqual([(c["name"], c["count"]) for c in facets["collection"]], [("Spring", 2), ("Summer", 2)])
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertLessEqual(len(ctx.captured_queries), 6)
+
+    def test_filters_apply(self):
+        response = self.client.get(f"/api/products/facets/?collection={self.spring.pk}&min_price=100")
+        facets = response.data["facets"]
+        self.assertEqual([(c["name"], c["count"]) for c in facets["category"]], [("Veils", 1)])
+        self.assertEqual([(c["name"], c["count"]) for c in facets["collection"]], [("Spring", 1), ("Summer", 1)])
+        self.assertEqual(len(response.data["results"]), 1)
+
+
+    def test_membership_and_renames_refresh_cached_facets(self):
+        self.client.get("/api/products/facets/")
+        winter = Collection.objects.create(name="Winter")
+        winter.products.add(Product.objects.get(price=3000))
+        gowns = Category.objects.get(name="Gowns")
+        gowns.name = "Ball Gowns"
+        gowns.save()
+        facets = self.client.get("/api/products/facets/").data["facets"]
+        self.assertEqual([c["name"] for c in facets["category"]], ["Ball Gowns", "Veils"])
+        self.assertIn(("Winter", 1), [(c["name"], c["count"]) for c in facets["collection"]])
+
+
+class ProductImportTests(TestCase):
+    def setUp(self):
+        self.designer = User.objects.create_user(username="atelier", email="atelier@example.com", password="pass12345", role="designer")
+        self.client = APIClient()
+        self.client.force_authenticate(self.designer)
+        self.gowns = Category.objects.create(name="Gowns")
+        Product.objects.create(category=self.gowns, sku="G-1", name="Old name", price=1, stock=1)
+
+    def test_csv_upsert_with_row_errors(self):
+        body = (
+            "sku,name,description,price,stock,category\n"
+            "G-1,Ivory Gown,Updated,1200.00,4,Gowns\n"
+            f"G-2,Blush Gown,,900,2,{self.gowns.pk}\n"
+            "G-3,Broken,,not-a-price,2,Gowns\n"
+            "G-4,Orphan,,10,1,Hats\n"
+        )
+        upload = SimpleUploadedFile("spring.csv", body.encode("utf-8"), content_type="text/csv")
+        response = self.client.post("/api/products/import/", {"file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data["imported"], 2)
+        self.assertEqual([error["line"] for error in response.data["errors"]], [4, 5])
+        updated = Product.objects.get(sku="G-1")
+        self.assertEqual((updated.name, updated.stock), ("Ivory Gown", 4))
+        self.assertTrue(Product.objects.filter(sku="G-2", category=self.gowns).exists())
+        self.assertEqual(search.get_index().search("product", ["blush"], 10), [Product.objects.get(sku="G-2").pk])
+
+    def test_undecodable_and_malformed_rows_are_row_errors(self):
+        body = (
+            b"sku,name,description,price,stock,category\n"
+            b"G-5,Good Gown,,100,1,Gowns\n"
+            b"G-6,Bad \xff Gown,,100,1,Gowns\n"
+            b"G-7,Huge," + b"x" * 200000 + b",100,1,Gowns\n"
+            b"G-8,Other Gown,,100,1,Gowns\n"
+        )
+        upload = SimpleUploadedFile("mixed.csv", body, content_type="text/csv")
+        response = self.client.post("/api/products/import/", {"file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data["imported"], 2)
+        self.assertEqual([error["line"] for error in response.data["errors"]], [3, 4])
+        self.assertEqual(response.data["errors"][0]["errors"]["non_field_errors"], ["Invalid UTF-8 byte sequence."])
+        self.assertEqual(sorted(Product.objects.filter(sku__in=["G-5", "G-6", "G-8"]).values_list("sku", flat=True)), ["G-5", "G-8"])
+
+        lines = b'{"sku": "J-1", "name": "Ok", "price": "5", "category": "Gowns"}\n{"sku": "J-2", "name": "\xfe"}\n'
+        report = ProductImporter().run(BytesIO(lines), "jsonl")
+        self.assertEqual((report["imported"], [error["line"] for error in report["errors"]]), (1, [2]))
+
+    def test_reimport_without_stock_or_description_keeps_them(self):
+        sharded = Product.objects.create(category=self.gowns, sku="G-9", name="Drop gown", description="Silk", price=1, stock=6)
+        services.reshard_stock(sharded.pk, 2)
+        body = "sku,name,price,category\nG-1,Ivory Gown,1200.00,Gowns\nG-9,Drop gown,950,Gowns\nG-10,New Gown,80,Gowns\n"
+        report = ProductImporter().run(StringIO(body), "csv")
+        self.assertEqual(report["imported"], 3, report)
+        updated = Product.objects.get(sku="G-1")
+        self.assertEqual((updated.name, updated.price, updated.stock), ("Ivory Gown", Decimal("1200.00"), 1))
+        sharded.refresh_from_db()
+        self.assertEqual((sharded.price, sharded.description, sharded.stock_on_hand), (Decimal("950.00"), "Silk", 6))
+        self.assertEqual(Product.objects.get(sku="G-10").stock, 0)
+
+        lines = '{"sku": "G-9", "name": "Drop gown", "price": "950", "stock": 2, "category": "Gowns"}\n'
+        ProductImporter().run(StringIO(lines), "jsonl")
+        sharded.refresh_from_db()
+        self.assertEqual((sharded.description, sharded.stock_on_hand), ("Silk", 2))
+
+    def test_jsonl_command_batches(self):
+        lines = [json.dumps({"sku": f"V-{i}", "name": f"Veil {i}", "price": "50", "category": "Gowns"}) for i in range(25)]
+        lines.insert(3, "{not json")
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as handle:
+            handle.write("\n".join(lines))
+        self.addCleanup(os.remove, handle.name)
+        out, err = StringIO(), StringIO()
+        with CaptureQueriesContext(connection) as ctx:
+            call_command("import_products", handle.name, "--batch-size", "10", stdout=out, stderr=err)
+        self.assertIn("Imported 25 product(s), 1 row(s) failed.", out.getvalue())
+        self.assertIn("line 4", err.getvalue())
+        self.assertEqual(Product.objects.filter(sku__startswith="V-").count(), 25)
+        self.assertLess(len(ctx.captured_queries), 30)
+
+
+class BulkStockTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username="warehouse", email="wh@example.com", password="pass12345", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        category = Category.objects.create(name="Belts")
+        self.products = [Product.objects.create(category=category, name=f"Belt {i}", price=5, stock=5) for i in range(3)]
+
+    def post(self, adjustments):
+        return self.client.post("/api/products/stock/", {"adjustments": adjustments}, format="json")
+
+    def test_deltas_and_sets(self):
+        a, b, c = self.products
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post([
+                {"product_id": a.pk, "delta": -5},
+                {"product_id": b.pk, "delta": 7},
+                {"product_id": c.pk, "set": 0},
+            ])
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([row["stock"] for row in response.data["results"]], [0, 12, 0])
+        self.assertEqual(len([q for q in ctx.captured_queries if q["sql"].startswith(("UPDATE", "SELECT"))]), 2)
+
+    def test_all_or_nothing(self):
+        a, b, _ = self.products
+        response = self.post([
+            {"product_id": a.pk, "delta": -4},
+            {"product_id": b.pk, "delta": -6},
+            {"product_id": 9999, "set": 3},
+        ])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(
+            sorted(failure["product_id"] for failure in response.data["failures"]), [b.pk, 9999]
+        )
+        a.refresh_from_db()
+        self.assertEqual(a.stock, 5)
+
+    def test_validation(self):
+        a = self.products[0]
+        self.assertEqual(self.post([{"product_id": a.pk}]).status_code, 400)
+        self.assertEqual(self.post([{"product_id": a.pk, "delta": 1}, {"product_id": a.pk, "set": 1}]).status_code, 400)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        caches["catalog"].clear()
+        self.user = User.objects.create_user(username="app", email="app@example.com", password="pass12345")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name="Jewellery")
+
+    def test_not_modified_until_a_write(self):
+        first = self.client.get("/api/categories/")
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("Last-Modified", first)
+        with CaptureQueriesContext(connection) as ctx:
+            again = self.client.get("/api/categories/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(self.client.get("/api/categories/?page=2", HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 404)
+
+        Category.objects.create(name="Hair")
+        changed = self.client.get("/api/categories/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], first["ETag"])
+
+    def test_membership_change_revalidates_filtered_products(self):
+        collection = Collection.objects.create(name="Heirloom")
+        product = Product.objects.create(category=self.category, name="Pearl Drops", price=40)
+        url = f"/api/products/?collection={collection.pk}"
+        first = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+        collection.products.add(product)
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual([row["id"] for row in changed.data["results"]], [product.pk])
+
+    def test_if_modified_since(self):
+        first = self.client.get(f"/api/categories/{self.category.pk}/")
+        response = self.client.get(f"/api/categories/{self.category.pk}/", HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+
+class FastPathEquivalenceTests(TestCase):
+    """The .values() list path must render exactly what the serializers render."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="clerk", email="clerk@example.com", password="pass12345", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Gowns")
+        self.products = [
+            Product.objects.create(category=category, name=f"Gown {i}", price=Decimal(prices), stock=20, sku=sku)
+            for i, (prices, sku) in enumerate([("100.5", "G-1"), ("99.99", None), ("1250", "G-3"), ("0.1", None)])
+        ]
+        Product.objects.filter(pk=self.products[0].pk).update(rating_count=3, rating_sum=13, rating_4=2, rating_5=1)
+        for product in self.products[:3]:
+            services.create_order(self.user, [(product.pk, 2), (self.products[3].pk, 1)])
+
+    def render(self, url, viewset, fast):
+        caches["catalog"].clear()
+        with mock.patch.object(viewset, "fast_list", fast):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def assert_equivalent(self, url, viewset):
+        while url:
+            fast, slow = self.render(url, viewset, True), self.render(url, viewset, False)
+            self.assertEqual(json.loads(fast.content), json.loads(slow.content))
+            self.assertEqual(fast.content, slow.content)  # Same field order too
+            url = fast.data.get("next")
+
+    def test_product_lists(self):
+        urls = [
+            "/api/products/", "/api/products/?page_size=3", "/api/products/?ordering=rating_average&page_size=2",
+            "/api/products/?ordering=-price&page_size=3", "/api/products/?fields=id,price,rating_histogram",
+            "/api/products/?search=gown", "/api/products/?page=1&page_size=2",
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assert_equivalent(url, ProductViewSet)
+
+    def test_order_lists(self):
+        urls = [
+            "/api/orders/", "/api/orders/?page_size=2", "/api/orders/?expand=user,items.product",
+            "/api/orders/?fields=id,total_price,items.price", "/api/orders/?ordering=total_price&page=1",
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assert_equivalent(url, OrderViewSet)
+
+    def test_fast_path_builds_no_instances(self):
+        caches["catalog"].clear()
+        with mock.patch.object(Product, "from_db", side_effect=AssertionError("model instance built")):
+            self.assertEqual(self.client.get("/api/products/").status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get("/api/orders/?expand=items.product").status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 2)
+
+
+class FastJSONTests(TestCase):
+    def payload(self):
+        return {
+            "total_price": Decimal("1250.50"),
+            "reference": uuid.uuid4(),
+            "created_at": timezone.now(),
+            "date": timezone.now().date(),
+            "name": "Robe de mariée",
+            "histogram": {1: 0, "5": 2},
+            "items": [{"price": Decimal("0.10"), "quantity": 2}],
+        }
+
+    def test_renderer_matches_stdlib(self):
+        data = self.payload()
+        self.assertEqual(renderers.FastJSONRenderer().render(data), JSONRenderer().render(data))
+        indented = renderers.FastJSONRenderer().render(data, "application/json; indent=4")
+        self.assertEqual(indented, JSONRenderer().render(data, "application/json; indent=4"))
+
+    def test_parser_round_trip_and_errors(self):
+        body = renderers.FastJSONRenderer().render(self.payload())
+        self.assertEqual(renderers.FastJSONParser().parse(BytesIO(body)), JSONParser().parse(BytesIO(body)))
+        with self.assertRaises(ParseError):
+            renderers.FastJSONParser().parse(BytesIO(b'{"price": NaN}'))
+
+    def test_falls_back_without_orjson(self):
+        data = self.payload()
+        with mock.patch.object(renderers, "orjson", None):
+            self.assertEqual(renderers.FastJSONRenderer().render(data), JSONRenderer().render(data))
+            self.assertEqual(renderers.FastJSONParser().parse(BytesIO(b'{"a": [1]}')), {"a": [1]})
+
+    def test_api_uses_fast_renderer(self):
+        user = User.objects.create_user(username="json", email="json@example.com", password="pass12345")
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post("/api/orders/", {"items": []}, format="json")
+        self.assertIsInstance(response.accepted_renderer, renderers.FastJSONRenderer)
+        self.assertEqual(json.loads(response.content), {"items": ["An order needs at least one item."]})
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username="finance", email="finance@example.com", password="pass12345", is_staff=True)
+        self.customer = User.objects.create_user(username="guest", email="guest@example.com", password="pass12345")
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        category = Category.objects.create(name="Rings")
+        self.products = [
+            Product.objects.create(category=category, name=f"Ring {i}", price=Decimal("19.99"), stock=50, sku=f"R-{i}")
+            for i in range(3)
+        ]
+        self.orders = [
+            services.create_order(user, [(self.products[0].pk, 1), (self.products[i % 3].pk, 2)])
+            for i, user in enumerate([self.admin, self.customer, self.customer, self.admin])
+        ]
+        Order.objects.filter(pk=self.orders[0].pk).update(status="completed")
+        Payment.objects.create(user=self.customer, amount=Decimal("59.97"), status="Completed")
+        Payment.objects.create(user=self.admin, amount=Decimal("10.00"))
+
+    def download(self, url, **extra):
+        response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode("utf-8"), response
+
+    def test_orders_csv_honours_list_filters(self):
+        body, response = self.download(f"/api/orders/export.csv?user={self.customer.pk}")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="order.csv"')
+        rows = list(csv.reader(StringIO(body)))
+        self.assertEqual(rows[0], ["id", "user_id", "user__email", "status", "total_price", "created_at"])
+        self.assertEqual([int(row[0]) for row in rows[1:]], [self.orders[2].pk, self.orders[1].pk])
+        self.assertEqual(rows[1][2:5], ["guest@example.com", "pending", "59.97"])
+
+        body, _ = self.download("/api/orders/export/?format=csv&status=completed")
+        self.assertEqual(len(body.strip().splitlines()), 2)
+
+    def test_order_items_ndjson_in_chunks(self):
+        with mock.patch.object(OrderItemViewSet, "export_chunk_size", 2):
+            response = self.client.get(f"/api/order-items/export/?user={self.customer.pk}", HTTP_ACCEPT="application/x-ndjson")
+            chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        lines = [json.loads(line) for line in b"".join(chunks).decode("utf-8").splitlines()]
+        self.assertEqual(len(lines), 4)
+        self.assertEqual({line["order_id"] for line in lines}, {self.orders[1].pk, self.orders[2].pk})
+        self.assertEqual(lines[0]["price"], "19.99")
+
+    def test_payments_and_users(self):
+        body, _ = self.download("/api/payments/export.ndjson?status=Completed")
+        payment = json.loads(body)
+        self.assertEqual(payment["amount"], "59.97")
+        self.assertEqual(payment["reference"], str(Payment.objects.get(status="Completed").reference))
+
+        body, _ = self.download("/api/users/export.csv?search=guest")
+        self.assertIn("guest@example.com", body)
+        self.assertNotIn("finance@example.com", body)
+
+    def test_admin_only(self):
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get("/api/orders/export.csv").status_code, 403)
+        self.assertEqual(self.client.get("/api/payments/export/").status_code, 403)
+
+
+    def test_schema_documents_the_payment_export(self):
+        with self.assertNoLogs("drf_yasg", level="WARNING"):
+            response = self.client.get("/swagger/?format=openapi")
+        self.assertEqual(response.status_code, 200)
+        operation = json.loads(response.content)["paths"]["/payments/export/"]["get"]
+        self.assertIn("200", operation["responses"])
+
+
+@mock.patch.object(EstimatedCountPagination, "exact_count_limit", 4)
+class EstimatedCountTests(TestCase):
+    def setUp(self):
+        caches["catalog"].clear()
+        self.admin = User.objects.create_user(username="auditor", email="auditor@example.com", password="pass12345", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        category = Category.objects.create(name="Veils")
+        self.products = [Product.objects.create(category=category, name=f"Veil {i}", price=30, stock=100) for i in range(3)]
+        self.orders = [
+            services.create_order(self.admin, [(product.pk, 1) for product in self.products]) for _ in range(2)
+        ]
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        counts = [q["sql"] for q in ctx.captured_queries if "COUNT(" in q["sql"].upper()]
+        return response.data, counts
+
+    def test_small_results_are_exact(self):
+        data, _ = self.get(f"/api/order-items/?order={self.orders[0].pk}")
+        self.assertEqual((data["count"], data["count_approximate"]), (3, False))
+
+    def test_unfiltered_count_comes_from_signal_counter(self):
+        data, _ = self.get("/api/order-items/")
+        self.assertEqual((data["count"], data["count_approximate"]), (6, True))
+        with self.captureOnCommitCallbacks(execute=True):
+            services.create_order(self.admin, [(self.products[0].pk, 1), (self.products[1].pk, 1)])
+        data, count_queries = self.get("/api/order-items/")
+        self.assertEqual((data["count"], data["count_approximate"]), (8, True))
+        self.assertTrue(all("LIMIT" in sql.upper() for sql in count_queries), count_queries)
+
+    def test_filtered_count_is_cached(self):
+        for _ in range(2):
+            services.create_order(self.admin, [(self.products[0].pk, 1)])
+        url = f"/api/order-items/?product={self.products[0].pk}"
+        self.assertEqual(self.get(url)[0]["count"], 4)  # At the limit: still exact
+        services.create_order(self.admin, [(self.products[0].pk, 1)])
+        data, _ = self.get(url)
+        self.assertEqual((data["count"], data["count_approximate"]), (5, True))
+        data, count_queries = self.get(url)
+        self.assertEqual(data["count"], 5)
+        self.assertTrue(all("LIMIT" in sql.upper() for sql in count_queries), count_queries)
+
+    def test_numbered_order_pages_flag_the_count(self):
+        data, _ = self.get("/api/orders/?page=1")
+        self.assertEqual((data["count"], data["count_approximate"]), (2, False))
+
+
+class OrderCategoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer", email="buyer@example.com", password="pass12345", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.gowns, self.veils = Category.objects.create(name="Gowns"), Category.objects.create(name="Veils")
+        self.gown = Product.objects.create(category=self.gowns, name="Gown", price=500, stock=50)
+        self.gown_2 = Product.objects.create(category=self.gowns, name="Gown II", price=600, stock=50)
+        self.veil = Product.objects.create(category=self.veils, name="Veil", price=50, stock=50)
+        self.both = services.create_order(self.user, [(self.gown.pk, 1), (self.gown_2.pk, 1), (self.veil.pk, 1)])
+        self.veil_only = services.create_order(self.user, [(self.veil.pk, 2)])
+
+    def links(self, order):
+        return set(OrderCategory.objects.filter(order=order).values_list("category_id", flat=True))
+
+    def test_create_order_links_categories(self):
+        self.assertEqual(self.links(self.both), {self.gowns.pk, self.veils.pk})
+        self.assertEqual(self.links(self.veil_only), {self.veils.pk})
+
+    def test_category_filter_is_a_semi_join_without_duplicates(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f"/api/orders/?items__product__category={self.gowns.pk}")
+        self.assertEqual([order["id"] for order in response.data["results"]], [self.both.pk])
+        sql = next(q["sql"] for q in ctx.captured_queries if 'FROM "bridal_api_order"' in q["sql"])
+        self.assertIn("EXISTS", sql.upper())
+        self.assertNotIn("bridal_api_orderitem", sql)
+        response = self.client.get(f"/api/orders/?category={self.veils.pk}")
+        self.assertEqual({order["id"] for order in response.data["results"]}, {self.both.pk, self.veil_only.pk})
+
+    def test_item_writes_resync_links(self):
+        OrderItem.objects.filter(order=self.both, product=self.veil).get().delete()
+        self.assertEqual(self.links(self.both), {self.gowns.pk})
+        OrderItem.objects.create(order=self.veil_only, product=self.gown, quantity=1, price=500)
+        self.assertEqual(self.links(self.veil_only), {self.gowns.pk, self.veils.pk})
+
+    def test_order_delete_skips_per_item_resync(self):
+        order = services.create_order(self.user, [(self.gown.pk, 1), (self.veil.pk, 1), (self.gown_2.pk, 1)])
+        with CaptureQueriesContext(connection) as ctx:
+            order.delete()
+        self.assertEqual(len(ctx.captured_queries), 4)  # Collect items, then one DELETE per table
+        self.assertFalse(OrderCategory.objects.filter(order_id=order.pk).exists())
+        self.assertEqual(self.links(self.both), {self.gowns.pk, self.veils.pk})
+
+    def test_migration_backfills_links(self):
+        OrderCategory.objects.all().delete()
+        migration = importlib.import_module("bridal_api.migrations.0020_order_categories")
+        migration.backfill_order_categories(apps, None)
+        self.assertEqual(self.links(self.both), {self.gowns.pk, self.veils.pk})
+        self.assertEqual(OrderCategory.objects.count(), 3)
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN output is SQLite's")
+class OwnerScopedListPlanTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Shoes")
+        product = Product.objects.create(category=category, name="Heel", price=80, stock=500)
+        designer = Designer.objects.create(name="Ana")
+        self.users = [
+            User.objects.create_user(username=f"owner{i}", email=f"owner{i}@example.com", password="pass12345")
+            for i in range(2)
+        ]
+        for user in self.users:
+            for day in range(12):
+                services.create_order(user, [(product.pk, 1)])
+                Appointment.objects.create(user=user, designer=designer, appointment_date=timezone.now() + timedelta(days=day))
+            CartItem.objects.create(cart=Cart.objects.create(user=user), product=product)
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def list_query(self, url, table):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        sql = next(
+            q["sql"] for q in ctx.captured_queries
+            if f'FROM "{table}"' in q["sql"] and "COUNT(" not in q["sql"].upper()
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            plan = " | ".join(row[-1] for row in cursor.fetchall())
+        return response.data, plan
+
+    def test_owner_lists_use_composite_indexes_without_sorting(self):
+        cases = [
+            ("/api/orders/", "bridal_api_order"),
+            ("/api/orders/?page=2", "bridal_api_order"),
+            ("/api/appointments/", "bridal_api_appointment"),
+            ("/api/appointments/?ordering=appointment_date", "bridal_api_appointment"),
+        ]
+        for url, table in cases:
+            with self.subTest(url=url):
+                data, plan = self.list_query(url, table)
+                self.assertNotIn("TEMP B-TREE", plan)
+                self.assertIn("USING INDEX bridal_api__user_id_", plan)
+                self.assertTrue(all(row["user"] == self.users[0].pk for row in data["results"]))
+
+        data, plan = self.list_query("/api/orders/", "bridal_api_order")
+        _, plan = self.list_query(data["next"], "bridal_api_order")
+        self.assertNotIn("TEMP B-TREE", plan)
+
+        data, plan = self.list_query("/api/cart-items/", "bridal_api_cartitem")
+        self.assertNotIn("TEMP B-TREE", plan)
+        self.assertEqual(data["count"], 1)
+
+
+class OwnerScopingTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Veils")
+        self.product = Product.objects.create(category=category, name="Cathedral", price=40, stock=100)
+        self.designer = Designer.objects.create(name="Lia")
+        self.owner, self.other = [
+            User.objects.create_user(username=f"scoped{i}", email=f"scoped{i}@example.com", password="pass12345")
+            for i in range(2)
+        ]
+        self.orders = {user: services.create_order(user, [(self.product.pk, 1)]) for user in (self.owner, self.other)}
+        self.carts = {user: Cart.objects.create(user=user) for user in (self.owner, self.other)}
+        self.appointments = {
+            user: Appointment.objects.create(user=user, designer=self.designer, appointment_date=timezone.now())
+            for user in (self.owner, self.other)
+        }
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_lists_and_details_only_show_own_rows(self):
+        other_item = self.orders[self.other].items.get()
+        cases = [
+            ("/api/carts/", f"/api/carts/{self.carts[self.other].pk}/", 404),
+            ("/api/order-items/", f"/api/order-items/{other_item.pk}/", 403),  # Read-only to non-staff anyway
+            ("/api/orders/", f"/api/orders/{self.orders[self.other].pk}/", 404),
+            ("/api/appointments/", f"/api/appointments/{self.appointments[self.other].pk}/", 404),
+        ]
+        for list_url, other_url, delete_status in cases:
+            with self.subTest(url=list_url):
+                results = self.client.get(list_url).data["results"]
+                self.assertEqual(len(results), 1)
+                self.assertEqual(self.client.get(other_url).status_code, 404)
+                self.assertEqual(self.client.delete(other_url).status_code, delete_status)
+
+    def test_object_check_does_not_load_users(self):
+        url = f"/api/appointments/{self.appointments[self.owner].pk}/"
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(url, {"notes": "Second fitting"}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertFalse([q for q in ctx.captured_queries if 'FROM "bridal_api_user"' in q["sql"]])
+
+        cart_item = CartItem.objects.create(cart=self.carts[self.owner], product=self.product)
+        response = self.client.patch(f"/api/cart-items/{cart_item.pk}/", {"quantity": 2}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_order_items_are_read_only_to_their_owner(self):
+        item = self.orders[self.owner].items.get()
+        url = f"/api/order-items/{item.pk}/"
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.patch(url, {"price": "0.01", "quantity": 9}, format="json").status_code, 403)
+        self.assertEqual(self.client.delete(url).status_code, 403)
+        body = {"order": self.orders[self.owner].pk, "product_id": self.product.pk, "quantity": 1, "price": "0.01"}
+        self.assertEqual(self.client.post("/api/order-items/", body, format="json").status_code, 403)
+        item.refresh_from_db()
+        self.assertEqual((item.quantity, item.price), (1, Decimal("40.00")))
+
+        staff = User.objects.create_user(username="backoffice", email="backoffice@example.com", password="pass12345", is_staff=True)
+        self.client.force_authenticate(staff)
+        self.assertEqual(self.client.patch(url, {"quantity": 2}, format="json").status_code, 200)
+
+    def test_create_assigns_owner(self):
+        response = self.client.post(
+            "/api/appointments/", {"designer_id": self.designer.pk, "notes": "First fitting"}, format="json"
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Appointment.objects.get(pk=response.data["id"]).user, self.owner)
+
+
+class CartCheckoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="checkout", email="checkout@example.com", password="pass12345")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Jewellery")
+        self.products = [
+            Product.objects.create(category=category, name=f"Tiara {i}", price=Decimal("25.00"), stock=5)
+            for i in range(12)
+        ]
+        self.cart = Cart.objects.create(user=self.user)
+
+    def checkout(self, products, quantity=1):
+        CartItem.objects.bulk_create([CartItem(cart=self.cart, product=p, quantity=quantity) for p in products])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(f"/api/carts/{self.cart.pk}/checkout/")
+        return response, len(ctx.captured_queries)
+
+    def test_checkout_places_order_and_empties_cart(self):
+        response, _ = self.checkout(self.products[:2], quantity=2)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Decimal(response.data["total_price"]), Decimal("100.00"))
+        self.assertEqual(len(response.data["items"]), 2)
+        self.assertFalse(self.cart.items.exists())
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock, 3)
+
+    def test_query_count_does_not_grow_with_cart(self):
+        small, small_queries = self.checkout(self.products[:1])
+        large, large_queries = self.checkout(self.products[1:])
+        self.assertEqual(small.status_code, 201, small.data)
+        self.assertEqual(large.status_code, 201, large.data)
+        self.assertEqual(small_queries, large_queries)
+
+    def test_rejected_checkout_keeps_cart(self):
+        response, _ = self.checkout(self.products[:2], quantity=6)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.cart.items.count(), 2)
+        self.assertFalse(Order.objects.exists())
+
+        self.cart.items.all().delete()
+        response = self.client.post(f"/api/carts/{self.cart.pk}/checkout/")
+        self.assertEqual(response.status_code, 400)
+
+    def test_cart_is_locked_before_items_and_products(self):
+        CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        for call in (
+            lambda: services.update_cart(self.cart, [(self.products[1].pk, 1)]),
+            lambda: services.checkout_cart(self.cart),
+        ):
+            with CaptureQueriesContext(connection) as ctx:
+                call()
+            selects = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("SELECT")]
+            self.assertIn('FROM "bridal_api_cart"', selects[0])
+
+
+class CartBulkUpdateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="basket", email="basket@example.com", password="pass12345")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Accessories")
+        self.products = [Product.objects.create(category=category, name=f"Glove {i}", price=10, stock=50) for i in range(10)]
+        self.cart = Cart.objects.create(user=self.user)
+        self.url = f"/api/carts/{self.cart.pk}/items/"
+
+    def post(self, lines):
+        items = [{"product_id": product.pk, "quantity": quantity} for product, quantity in lines]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.url, {"items": items}, format="json")
+        return response, len(ctx.captured_queries)
+
+    def test_upserts_and_removes_in_one_request(self):
+        CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        CartItem.objects.create(cart=self.cart, product=self.products[1], quantity=1)
+        response, _ = self.post([(self.products[0], 4), (self.products[1], 0), (self.products[2], 2)])
+        self.assertEqual(response.status_code, 200, response.data)
+        quantities = {item["product"]: item["quantity"] for item in response.data["items"]}
+        self.assertEqual(quantities, {self.products[0].pk: 4, self.products[2].pk: 2})
+        self.assertEqual(self.cart.items.count(), 2)
+
+    def test_query_count_does_not_grow_with_batch(self):
+        _, small_queries = self.post([(self.products[0], 1), (self.products[1], 0)])
+        _, large_queries = self.post([(product, 3) for product in self.products[:8]] + [(self.products[9], 0)])
+        self.assertEqual(small_queries, large_queries)
+
+    def test_rejects_duplicates_and_unknown_products(self):
+        response, _ = self.post([(self.products[0], 1), (self.products[0], 2)])
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, {"items": [{"product_id": 999, "quantity": 1}]}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.cart.items.exists())
+
+
+class ShardedStockTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="flash", email="flash@example.com", password="pass12345")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Limited")
+        self.gown = Product.objects.create(category=category, name="Drop gown", price=900, stock=10)
+        self.veil = Product.objects.create(category=category, name="Drop veil", price=90, stock=4)
+        call_command("shard_stock", str(self.gown.pk), "--shards", "3", stdout=StringIO())
+
+    def shards(self):
+        return list(StockShard.objects.filter(product=self.gown).order_by("shard").values_list("stock", flat=True))
+
+    def order(self, quantity):
+        items = [{"product_id": self.gown.pk, "quantity": quantity}, {"product_id": self.veil.pk, "quantity": 1}]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post("/api/orders/", {"items": items}, format="json")
+        return response, [q["sql"] for q in ctx.captured_queries]
+
+    def test_resharding_moves_stock_and_reads_sum_shards(self):
+        self.gown.refresh_from_db()
+        self.assertEqual((self.gown.stock, self.gown.stock_shards, self.shards()), (0, 3, [4, 3, 3]))
+        listed = {row["id"]: row["stock"] for row in self.client.get("/api/products/").data["results"]}
+        self.assertEqual(listed[self.gown.pk], 10)
+        self.assertEqual(self.client.get(f"/api/products/{self.gown.pk}/").data["stock"], 10)
+
+        services.reshard_stock(self.gown.pk, 0)
+        self.gown.refresh_from_db()
+        self.assertEqual((self.gown.stock, self.gown.stock_shards, self.shards()), (10, 0, []))
+
+    def test_order_takes_from_one_shard_without_touching_the_product_row(self):
+        with mock.patch("bridal_api.services.random.randrange", return_value=1):
+            response, queries = self.order(2)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.shards(), [4, 1, 3])
+        # The only product UPDATE is the veil's; the gown's row is not written
+        self.assertEqual(len([sql for sql in queries if sql.startswith('UPDATE "bridal_api_product"')]), 1)
+        self.veil.refresh_from_db()
+        self.assertEqual(self.veil.stock, 3)
+
+    def test_short_shard_falls_back_to_exact_drain(self):
+        services.adjust_stock(deltas={self.gown.pk: 2})  # lands on the product row
+        response, _ = self.order(11)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.gown.refresh_from_db()
+        self.assertEqual(self.gown.stock + sum(self.shards()), 1)
+
+        response, _ = self.order(2)
+        self.assertEqual(response.status_code, 400)
+        self.gown.refresh_from_db()
+        self.assertEqual(self.gown.stock_on_hand, 1)
+        self.veil.refresh_from_db()
+        self.assertEqual(self.veil.stock, 3)
+
+    def test_product_lists_read_shard_totals_in_the_list_query(self):
+        category = self.gown.category
+        for i in range(5):
+            product = Product.objects.create(category=category, name=f"Drop {i}", price=10, stock=6)
+            services.reshard_stock(product.pk, 2)
+        for fast in (True, False):
+            caches["catalog"].clear()
+            with mock.patch.object(ProductViewSet, "fast_list", fast), CaptureQueriesContext(connection) as ctx:
+                response = self.client.get("/api/products/?page_size=20")
+            stock = {row["id"]: row["stock"] for row in response.data["results"]}
+            self.assertEqual(stock[self.gown.pk], 10)
+            self.assertEqual(sorted(stock.values()), [4, 6, 6, 6, 6, 6, 10])
+            # No per-product aggregate: the totals come from the list query's subquery
+            self.assertFalse([q for q in ctx.captured_queries if q["sql"].startswith('SELECT SUM("bridal_api_stockshard"')])
+
+    def test_negative_delta_drains_the_shards(self):
+        staff = User.objects.create_user(username="stocker", email="stocker@example.com", password="pass12345", is_staff=True)
+        self.client.force_authenticate(staff)
+        services.adjust_stock(deltas={self.gown.pk: 1})  # lands on the product row
+        response = self.client.post("/api/products/stock/", {"adjustments": [
+            {"product_id": self.gown.pk, "delta": -4}, {"product_id": self.veil.pk, "delta": -1},
+        ]}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([row["stock"] for row in response.data["results"]], [7, 3])
+        self.gown.refresh_from_db()
+        self.assertEqual(self.gown.stock, 0)
+        response = self.client.post("/api/products/stock/", {"adjustments": [{"product_id": self.gown.pk, "delta": -8}]}, format="json")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["failures"][0]["detail"], "Stock 7 cannot cover a change of -8.")
+
+    def test_hold_missed_by_the_first_count_is_recounted(self):
+        cart = Cart.objects.create(user=User.objects.create_user(username="holder", email="holder@example.com"))
+        services.update_cart(cart, [(self.gown.pk, 9)])
+        counts = [{}]  # The first count misses the hold, as if it committed just after
+
+        def reserved_stock(*args, **kwargs):
+            return counts.pop() if counts else count(*args, **kwargs)
+
+        count = services.reserved_stock
+        with mock.patch("bridal_api.services.reserved_stock", side_effect=reserved_stock):
+            response, _ = self.order(2)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(sum(self.shards()), 10)
+        self.assertEqual(services.available_stock([self.gown.pk]), {self.gown.pk: 1})
+
+    def test_setting_a_level_replaces_the_shards(self):
+        stock = services.adjust_stock(levels={self.gown.pk: 5})
+        self.assertEqual(stock[self.gown.pk], 5)
+        self.assertEqual(self.shards(), [0, 0, 0])
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Capes")
+        self.cape = Product.objects.create(category=category, name="Lace cape", price=300, stock=5)
+        self.users = [
+            User.objects.create_user(username=f"holder{i}", email=f"holder{i}@example.com", password="pass12345")
+            for i in range(3)
+        ]
+        self.carts = [Cart.objects.create(user=user) for user in self.users[:2]]
+        self.client = APIClient()
+
+    def hold(self, index, quantity):
+        self.client.force_authenticate(self.users[index])
+        items = [{"product_id": self.cape.pk, "quantity": quantity}]
+        return self.client.post(f"/api/carts/{self.carts[index].pk}/items/", {"items": items}, format="json")
+
+    def test_cart_lines_hold_stock_from_other_carts_and_orders(self):
+        self.assertEqual(self.hold(0, 3).status_code, 200)
+        self.assertEqual(services.available_stock([self.cape.pk]), {self.cape.pk: 2})
+        self.assertEqual(self.hold(1, 3).status_code, 400)
+        self.assertEqual(self.hold(1, 2).status_code, 200)
+        self.assertEqual(self.hold(0, 3).status_code, 200)  # Re-saving its own line fits
+
+        self.client.force_authenticate(self.users[2])
+        order = {"items": [{"product_id": self.cape.pk, "quantity": 1}]}
+        self.assertEqual(self.client.post("/api/orders/", order, format="json").status_code, 400)
+
+    def test_checkout_consumes_the_hold(self):
+        self.hold(0, 3)
+        self.hold(1, 2)
+        response = self.client.post(f"/api/carts/{self.carts[1].pk}/checkout/")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.cape.refresh_from_db()
+        self.assertEqual(self.cape.stock, 3)
+        self.assertEqual(list(StockReservation.objects.values_list("quantity", flat=True)), [3])
+        self.assertEqual(services.available_stock([self.cape.pk]), {self.cape.pk: 0})
+
+    def test_direct_order_keeps_the_users_cart_hold(self):
+        self.hold(0, 3)
+        services.create_order(self.users[0], [(self.cape.pk, 1)])
+        self.assertEqual(list(StockReservation.objects.values_list("quantity", flat=True)), [3])
+        with self.assertRaises(services.InsufficientStock):
+            services.create_order(self.users[2], [(self.cape.pk, 2)])
+        self.client.force_authenticate(self.users[0])
+        self.assertEqual(self.client.post(f"/api/carts/{self.carts[0].pk}/checkout/").status_code, 201)
+        self.cape.refresh_from_db()
+        self.assertEqual(self.cape.stock, 1)
+
+    def test_expired_holds_are_ignored_and_swept(self):
+        self.hold(0, 5)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(services.available_stock([self.cape.pk]), {self.cape.pk: 5})
+        self.assertEqual(self.hold(1, 4).status_code, 200)
+
+        out = StringIO()
+        call_command("expire_reservations", stdout=out)
+        self.assertIn("Expired 1", out.getvalue())
+        self.assertEqual(StockReservation.objects.get().cart_item.cart, self.carts[1])
+        self.assertTrue(CartItem.objects.filter(cart=self.carts[0]).exists())
+
+    def test_removing_a_line_releases_its_hold(self):
+        self.hold(0, 5)
+        self.hold(0, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="retry", email="retry@example.com", password="pass12345")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Shawls")
+        self.product = Product.objects.create(category=category, name="Silk shawl", price=Decimal("45.00"), stock=10)
+
+    def order(self, key, quantity=2):
+        items = [{"product_id": self.product.pk, "quantity": quantity}]
+        return self.client.post("/api/orders/", {"items": items}, format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_first_order(self):
+        first = self.order("order-1")
+        self.assertEqual(first.status_code, 201, first.data)
+        with CaptureQueriesContext(connection) as ctx:
+            retry = self.order("order-1")
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(json.loads(retry.content), json.loads(first.content))
+        self.assertFalse([q for q in ctx.captured_queries if "bridal_api_product" in q["sql"]])
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+        self.assertEqual(self.order("order-2").status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_reused_key_in_flight_and_failures(self):
+        self.assertEqual(self.order("order-1").status_code, 201)
+        self.assertEqual(self.order("order-1", quantity=3).status_code, 422)
+
+        body = {"items": [{"product_id": self.product.pk, "quantity": 2}]}
+        digest = idempotency.fingerprint(mock.Mock(data=body))
+        IdempotencyKey.objects.create(user=self.user, scope="orders.create", key="busy", fingerprint=digest)
+        self.assertEqual(self.order("busy").status_code, 409)
+
+        # Rejected requests release their key
+        self.assertEqual(self.order("big", quantity=50).status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.filter(key="big").exists())
+
+    def test_payment_initiation_calls_the_gateway_once(self):
+        answer = {"status": "success", "data": {"checkout_url": "https://checkout.example/abc"}}
+        with mock.patch("bridal_api.gateway.ChapaClient.initialize", return_value=answer) as post:
+            responses = [
+                self.client.post("/api/payments/initiate/", {"amount": "150.00"}, format="json", HTTP_IDEMPOTENCY_KEY="pay-1")
+                for _ in range(3)
+            ]
+        self.assertEqual([r.status_code for r in responses], [200, 200, 200])
+        self.assertEqual(responses[2].data, {"checkout_url": "https://checkout.example/abc"})
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_purge_removes_expired_keys(self):
+        self.order("old")
+        self.order("new")
+        IdempotencyKey.objects.filter(key="old").update(created_at=timezone.now() - timedelta(days=2))
+        out = StringIO()
+        call_command("purge_idempotency_keys", stdout=out)
+        self.assertIn("Purged 1", out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list("key", flat=True)), ["new"])
+
+    def test_expired_key_is_a_new_claim(self):
+        self.assertEqual(self.order("stale").status_code, 201)
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        again = self.order("stale", quantity=1)  # Same key, different body: no 422 once expired
+        self.assertEqual(again.status_code, 201, again.data)
+        self.assertNotIn("Idempotent-Replayed", again)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(self.order("stale", quantity=1)["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_abandoned_claim_is_reclaimed_after_its_lease(self):
+        body = {"items": [{"product_id": self.product.pk, "quantity": 2}]}
+        digest = idempotency.fingerprint(mock.Mock(data=body))
+        IdempotencyKey.objects.create(user=self.user, scope="orders.create", key="crashed", fingerprint=digest)
+        with self.settings(IDEMPOTENCY_KEY_LEASE=60):
+            self.assertEqual(self.order("crashed").status_code, 409)
+            IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(seconds=61))
+            retry = self.order("crashed")
+        self.assertEqual(retry.status_code, 201, retry.data)
+        self.assertEqual(IdempotencyKey.objects.get(key="crashed").status_code, 201)
+        self.assertEqual(self.order("crashed")["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class ChapaStub:
+    """Local stand-in for the Chapa API, served from a thread on 127.0.0.1."""
+    def __init__(self):
+        self.requests = []
+        self.connections = set()
+        self.statuses = []  # Status codes for the next answers, then 200
+        self.delay = 0
+        self.outcomes = {}  # tx_ref -> transaction status for verify, default "success"
+        self.active = self.peak = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, so pooling is observable
+
+            def do_GET(self):
+                stub.answer(self)
+
+            def do_POST(self):
+                stub.answer(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def answer(self, handler):
+        body = json.loads(handler.rfile.read(int(handler.headers.get("Content-Length") or 0)) or b"{}")
+        self.requests.append((handler.command, handler.path))
+        self.connections.add(handler.client_address)
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        if handler.path.endswith("/initialize"):
+            payload = {"status": "success", "data": {"checkout_url": f"{self.url}/checkout/{body['tx_ref']}"}}
+        else:
+            outcome = self.outcomes.get(handler.path.rsplit("/", 1)[-1], "success")
+            payload = {"status": "success", "data": {"status": outcome}}
+        data = json.dumps(payload).encode()
+        try:
+            handler.send_response(self.statuses.pop(0) if self.statuses else 200)
+            handler.send_header("Content-Type", "application/json")
+            handler.send_header("Content-Length", str(len(data)))
+            handler.end_headers()
+            handler.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client timed out and hung up
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class PaymentGatewayTests(TestCase):
+    def setUp(self):
+        self.stub = ChapaStub()
+        self.addCleanup(self.stub.stop)
+        self.now = [0.0]
+        self.client_ = gateway.ChapaClient(
+            base_url=self.stub.url, secret_key="test", timeout=(1, 1), retries=2, backoff=0,
+            breaker=gateway.CircuitBreaker(threshold=2, reset_after=30, clock=lambda: self.now[0]),
+        )
+        self.addCleanup(self.client_.close)
+        self.user = User.objects.create_user(username="payer", email="payer@example.com", password="pass12345")
+
+    def test_connections_are_pooled(self):
+        for _ in range(3):
+            self.assertEqual(self.client_.verify("ref")["status"], "success")
+        self.assertEqual(len(self.stub.connections), 1)
+
+    def test_only_gets_are_retried_and_retries_are_bounded(self):
+        self.stub.statuses = [503, 503]
+        self.client_.verify("ref")
+        self.assertEqual(len(self.stub.requests), 3)
+
+        self.stub.statuses = [503] * 5
+        with self.assertRaises(gateway.GatewayUnavailable):
+            self.client_.verify("ref")
+        self.assertEqual(len(self.stub.requests), 6)
+
+        self.stub.statuses, self.stub.delay = [], 0.5
+        self.client_.timeout = (1, 0.1)
+        with self.assertRaises(gateway.GatewayUnavailable):
+            self.client_.initialize({"tx_ref": "x"})
+        self.assertEqual(len(self.stub.requests), 7)
+
+    def test_circuit_breaker_fails_fast_then_recovers(self):
+        self.stub.statuses = [500, 500]
+        for _ in range(2):
+            with self.assertRaises(gateway.GatewayUnavailable):
+                self.client_.verify("ref")
+        with self.assertRaises(gateway.GatewayUnavailable):
+            self.client_.verify("ref")
+        self.assertEqual(len(self.stub.requests), 2)
+
+        self.now[0] += 31
+        self.client_.verify("ref")
+        self.assertFalse(self.client_.breaker.is_open)
+
+    def test_payment_views(self):
+        with override_settings(CHAPA_BASE_URL=self.stub.url):
+            gateway.reset_client()
+            self.addCleanup(gateway.reset_client)
+            client = APIClient()
+            client.force_authenticate(self.user)
+            response = client.post("/api/payments/initiate/", {"amount": "99.00"}, format="json")
+            self.assertEqual(response.status_code, 200, response.data)
+            reference = str(Payment.objects.get().reference)
+            self.assertTrue(response.data["checkout_url"].endswith(reference))
+            response = client.get("/api/payments/verify/", {"tx_ref": reference})
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertEqual(Payment.objects.get().status, "successful")
+
+            self.stub.statuses = [500]
+            response = client.post("/api/payments/initiate/", {"amount": "99.00"}, format="json")
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(Payment.objects.latest("created_at").status, "Failed")
+
+    async def test_async_payment_views(self):
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        with override_settings(CHAPA_BASE_URL=self.stub.url):
+            gateway.reset_client()
+            self.addCleanup(gateway.reset_client)
+            response = await self.async_client.post(
+                "/api/payments/initiate/async/", {"amount": "120.00"}, content_type="application/json", headers=headers,
+            )
+            self.assertEqual(response.status_code, 200, response.content)
+            payment = await Payment.objects.aget()
+            self.assertTrue(response.json()["checkout_url"].endswith(str(payment.reference)))
+
+            response = await self.async_client.get(
+                "/api/payments/verify/async/", {"tx_ref": str(payment.reference)}, headers=headers,
+            )
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual((await Payment.objects.aget()).status, "successful")
+            response = await self.async_client.post("/api/payments/initiate/async/", {}, content_type="application/json")
+            self.assertEqual(response.status_code, 401)
+
+
+@override_settings(CHAPA_WEBHOOK_SECRET="hook-secret")
+class PaymentReconciliationTests(TestCase):
+    def setUp(self):
+        self.stub = ChapaStub()
+        self.addCleanup(self.stub.stop)
+        self.user = User.objects.create_user(username="payer", email="payer@example.com", password="pass12345")
+
+    def payment(self, age, status="Pending", outcome="success"):
+        payment = Payment.objects.create(user=self.user, amount=Decimal("50.00"), status=status)
+        Payment.objects.filter(pk=payment.pk).update(created_at=timezone.now() - age)
+        self.stub.outcomes[str(payment.reference)] = outcome
+        return payment
+
+    def test_reconcile_verifies_pending_payments_concurrently(self):
+        paid = self.payment(timedelta(hours=1))
+        failed = self.payment(timedelta(hours=1), outcome="failed")
+        open_ = self.payment(timedelta(hours=1), outcome="pending")
+        abandoned = self.payment(timedelta(days=2), outcome="pending")
+        fresh = self.payment(timedelta(minutes=1))
+        settled = self.payment(timedelta(hours=1), status="Failed")
+        self.stub.delay = 0.2
+        out = StringIO()
+        with override_settings(CHAPA_BASE_URL=self.stub.url):
+            gateway.reset_client()
+            self.addCleanup(gateway.reset_client)
+            with CaptureQueriesContext(connection) as ctx:
+                call_command("reconcile_payments", "--batch-size", "10", "--workers", "2", stdout=out)
+        self.assertIn("Checked 4 payment(s): 3 updated, 0 unreachable.", out.getvalue())
+        self.assertEqual(len(self.stub.requests), 4)
+        self.assertEqual(self.stub.peak, 2)
+        updates = [q for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 2)  # One per resulting status
+        statuses = dict(Payment.objects.values_list("pk", "status"))
+        self.assertEqual(statuses[paid.pk], "successful")
+        self.assertEqual(statuses[failed.pk], "Failed")
+        self.assertEqual(statuses[open_.pk], "Pending")
+        self.assertEqual(statuses[abandoned.pk], "Failed")
+        self.assertEqual(statuses[fresh.pk], "Pending")
+        self.assertEqual(statuses[settled.pk], "Failed")
+
+    def test_reconcile_stops_when_gateway_is_down(self):
+        for _ in range(3):
+            self.payment(timedelta(hours=1))
+        self.stub.statuses = [503] * 20
+        client = gateway.ChapaClient(
+            base_url=self.stub.url, secret_key="test", timeout=(1, 1), retries=0, backoff=0,
+            breaker=gateway.CircuitBreaker(threshold=1, reset_after=30),
+        )
+        self.addCleanup(client.close)
+        stats = reconciliation.reconcile_payments(batch_size=1, workers=1, client=client)
+        self.assertEqual(stats, {"checked": 1, "updated": 0, "unreachable": 1})
+        self.assertFalse(Payment.objects.exclude(status="Pending").exists())
+
+    def post_event(self, event, secret="hook-secret"):
+        body = json.dumps(event).encode()
+        signature = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        return APIClient().post(
+            "/api/payments/webhook/", body, content_type="application/json", headers={"Chapa-Signature": signature},
+        )
+
+    def test_webhook_settles_pending_payment(self):
+        payment = self.payment(timedelta(minutes=1))
+        response = self.post_event({"tx_ref": str(payment.reference), "status": "success"})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(Payment.objects.get().status, "successful")
+        # A late "failed" push does not overwrite a settled payment
+        self.post_event({"tx_ref": str(payment.reference), "status": "failed"})
+        self.assertEqual(Payment.objects.get().status, "successful")
+
+    def test_webhook_rejects_bad_signature(self):
+        payment = self.payment(timedelta(minutes=1))
+        response = self.post_event({"tx_ref": str(payment.reference), "status": "success"}, secret="wrong")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.post_event({"tx_ref": "not-a-uuid", "status": "success"}).status_code, 400)
+        self.assertEqual(Payment.objects.get().status, "Pending")
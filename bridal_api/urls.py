@@ -1,10 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from rest_framework.urlpatterns import format_suffix_patterns
 from .views import (
     UserViewSet, RegisterView, LoginView, LogoutView, ChangePasswordView,
     CategoryViewSet, ProductViewSet, CollectionViewSet, DesignerViewSet,
     AppointmentViewSet, CartViewSet, CartItemViewSet, OrderViewSet,
-    OrderItemViewSet, ReviewListCreateView, InitiatePaymentView, VerifyPaymentView
+    OrderItemViewSet, ReviewListCreateView, InitiatePaymentView, VerifyPaymentView,
+    PaymentExportView, PaymentWebhookView, initiate_payment_async, verify_payment_async
 )
 
 # DRF router
@@ -36,4 +38,11 @@ urlpatterns = [
     # -------------------- PAYMENT --------------------
     path('payments/initiate/', InitiatePaymentView.as_view(), name='initiate-payment'),
     path('payments/verify/', VerifyPaymentView.as_view(), name='verify-payment'),
+    path('payments/initiate/async/', initiate_payment_async, name='initiate-payment-async'),
+    path('payments/verify/async/', verify_payment_async, name='verify-payment-async'),
+    path('payments/webhook/', PaymentWebhookView.as_view(), name='payment-webhook'),
+    *format_suffix_patterns(
+        [path('payments/export/', PaymentExportView.as_view(), name='payment-export')],
+        allowed=['csv', 'ndjson'],
+    ),
 ]
@@ -1,37 +1,62 @@
 from rest_framework import viewsets, filters, status, generics
+from rest_framework.decorators import action
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAuthenticatedOrReadOnly
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken
-from drf_yasg.utils import swagger_auto_schema
+from drf_yasg.utils import no_body, swagger_auto_schema
 from drf_yasg import openapi
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
 from django.core.exceptions import PermissionDenied
 from django.shortcuts import render
 from django.contrib.auth import authenticate
+from django.db import transaction
+from django.db.models import Case, F, FloatField, OuterRef, Subquery, Sum, When, prefetch_related_objects
+from django.db.models.functions import Cast, Coalesce
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from asgiref.sync import sync_to_async
 
-import requests, os
+import hashlib
+import hmac
+import json
+import uuid
 
 from .models import (
     User, Category, Product, Collection, Designer, Appointment,
-    Cart, CartItem, Order, OrderItem, Review, Payment
+    Cart, CartItem, Order, OrderItem, Review, Payment, StockShard
 )
 from .serializers import (
     UserSerializer, RegisterSerializer, LoginSerializer, LogoutSerializer,
     ChangePasswordSerializer, CategorySerializer, ProductSerializer,
     CollectionSerializer, DesignerSerializer, AppointmentSerializer,
     CartSerializer, CartItemSerializer, OrderSerializer, OrderItemSerializer,
-    ReviewSerializer
+    ReviewSerializer, BulkStockSerializer, CartBulkSerializer
 )
-from .pagination import StandardResultsSetPagination
-from .permissions import IsAdmin, IsDesigner, IsAdminOrDesigner, IsOwnerOrAdmin
+from . import gateway, services
+from .cache import CatalogCacheMixin
+from .conditional import ConditionalGetMixin
+from .fastpath import FastListMixin
+from .exports import EXPORT_RENDERERS, ExportMixin, export_response
+from .idempotency import IDEMPOTENCY_HEADER, IdempotencyMixin
+from .filters import OrderFilter, PaymentFilter, ProductFilter, product_facets
+from .importers import FORMATS, ProductImporter, detect_format
+from .pagination import StandardResultsSetPagination, EstimatedCountPagination, KeysetOrPagePagination
+from .prefetch import PrefetchMixin
+from .search import FullTextSearchFilter
+from .permissions import IsAdmin, IsDesigner, IsAdminOrDesigner, IsOwnerOrAdmin, OwnerScopedMixin
 
 # -------------------- HOME PAGE --------------------
 def home(request):
     return render(request, "bridal_api/home.html")
 
 # -------------------- USER CRUD --------------------
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ExportMixin, PrefetchMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     pagination_class = StandardResultsSetPagination
@@ -40,6 +65,7 @@ class UserViewSet(viewsets.ModelViewSet):
     ordering_fields = ["date_joined", "username"]
     ordering = ["-date_joined"]
     permission_classes = [IsAdmin]
+    export_fields = ["id", "username", "email", "role", "is_active", "date_joined"]
 
 # -------------------- REGISTER --------------------
 class RegisterView(APIView):
@@ -108,7 +134,7 @@ class ChangePasswordView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # -------------------- CATEGORY --------------------
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, CatalogCacheMixin, PrefetchMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     pagination_class = StandardResultsSetPagination
@@ -119,33 +145,98 @@ class CategoryViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAdminOrDesigner]
 
 # -------------------- PRODUCT --------------------
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, CatalogCacheMixin, FastListMixin, PrefetchMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ["category"]
+    pagination_class = KeysetOrPagePagination
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, FullTextSearchFilter]
+    filterset_class = ProductFilter
     search_fields = ["name", "description"]
-    ordering_fields = ["price", "created_at"]
+    ordering_fields = ["price", "created_at", "rating_count", "rating_average"]
     ordering = ["-created_at"]
     permission_classes = [IsAdminOrDesigner]
+    # ?collection= / ?designer= and the facets read these
+    filter_dependencies = [Category, Collection, Designer]
+
+    def get_queryset(self):
+        # Shard totals in the same query, read by Product.stock_on_hand
+        shard_stock = StockShard.objects.filter(product=OuterRef("pk")).order_by().values("product").annotate(
+            total=Sum("stock")
+        ).values("total")
+        return super().get_queryset().annotate(
+            # Average from the denormalized aggregates: a column expression, no GROUP BY
+            rating_average=Case(
+                When(rating_count__gt=0, then=Cast("rating_sum", FloatField()) / F("rating_count")),
+                output_field=FloatField(),
+            ),
+            shard_stock=Coalesce(Subquery(shard_stock), 0),
+        )
+
+    @action(detail=False, methods=["get"])
+    def facets(self, request):
+        """The product page plus category, price and collection counts for the same filters."""
+        return self.cached_response(self._facets, request)
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('file', openapi.IN_FORM, type=openapi.TYPE_FILE, required=True, description="CSV or JSONL"),
+            openapi.Parameter('format', openapi.IN_FORM, type=openapi.TYPE_STRING, enum=list(FORMATS)),
+        ],
+        responses={200: 'Import report'}
+    )
+    @action(detail=False, methods=["post"], url_path="import", parser_classes=[MultiPartParser])
+    def import_products(self, request):
+        """Upsert products on sku from an uploaded CSV/JSONL file, reporting per-row errors."""
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"detail": "A 'file' upload is required."}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.data.get("format") or detect_format(upload.name)
+        if fmt not in FORMATS:
+            return Response({"detail": f"Format must be one of: {', '.join(FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(ProductImporter().run(upload, fmt))
+
+    @swagger_auto_schema(request_body=BulkStockSerializer, responses={200: 'New stock levels', 409: 'Rejected changes'})
+    @action(detail=False, methods=["post"], url_path="stock")
+    def bulk_stock(self, request):
+        """Apply stock deltas or absolute levels to many products in one transaction."""
+        serializer = BulkStockSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        adjustments = serializer.validated_data['adjustments']
+        deltas = {item['product_id']: item['delta'] for item in adjustments if 'delta' in item}
+        levels = {item['product_id']: item['set'] for item in adjustments if 'set' in item}
+        try:
+            stock = services.adjust_stock(deltas, levels)
+        except services.StockConflict as exc:
+            return Response({"detail": str(exc), "failures": exc.failures}, status=status.HTTP_409_CONFLICT)
+        return Response({"results": [
+            {"product_id": product_id, "stock": stock[product_id]} for product_id in sorted(stock)
+        ]})
+
+    def _facets(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        response.data["facets"] = product_facets(queryset)
+        return response
 
 # -------------------- COLLECTION --------------------
-class CollectionViewSet(viewsets.ModelViewSet):
+class CollectionViewSet(ConditionalGetMixin, CatalogCacheMixin, PrefetchMixin, viewsets.ModelViewSet):
     queryset = Collection.objects.all()
     serializer_class = CollectionSerializer
     pagination_class = StandardResultsSetPagination
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [filters.OrderingFilter, FullTextSearchFilter]
     search_fields = ["name", "description"]
     ordering_fields = ["name", "created_at"]
     ordering = ["name"]
     permission_classes = [IsAdminOrDesigner]
 
 # -------------------- DESIGNER --------------------
-class DesignerViewSet(viewsets.ModelViewSet):
+class DesignerViewSet(ConditionalGetMixin, CatalogCacheMixin, PrefetchMixin, viewsets.ModelViewSet):
     queryset = Designer.objects.all()
     serializer_class = DesignerSerializer
     pagination_class = StandardResultsSetPagination
+    filter_backends = [FullTextSearchFilter]
+    search_fields = ["name", "bio"]
     permission_classes = [IsAdmin]
 
     def create(self, request, *args, **kwargs):
@@ -154,10 +245,10 @@ class DesignerViewSet(viewsets.ModelViewSet):
         return super().create(request, *args, **kwargs)
 
 # -------------------- APPOINTMENT --------------------
-class AppointmentViewSet(viewsets.ModelViewSet):
+class AppointmentViewSet(PrefetchMixin, OwnerScopedMixin, viewsets.ModelViewSet):
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetOrPagePagination
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ["notes"]
     ordering_fields = ["appointment_date", "created_at"]
@@ -165,53 +256,117 @@ class AppointmentViewSet(viewsets.ModelViewSet):
     permission_classes = [IsOwnerOrAdmin]
 
 # -------------------- CART --------------------
-class CartViewSet(viewsets.ModelViewSet):
+class CartViewSet(PrefetchMixin, OwnerScopedMixin, viewsets.ModelViewSet):
     queryset = Cart.objects.all()
     serializer_class = CartSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [IsOwnerOrAdmin]
 
+    @swagger_auto_schema(request_body=CartBulkSerializer, responses={200: CartSerializer})
+    @action(detail=True, methods=["post"], url_path="items")
+    def update_items(self, request, pk=None):
+        """Add, re-quantify or remove (quantity 0) many products at once, holding their stock, and return the cart."""
+        cart = self.get_object()
+        serializer = CartBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = [(item['product_id'], item['quantity']) for item in serializer.validated_data['items']]
+        try:
+            services.update_cart(cart, lines)
+        except (services.UnknownProduct, services.InsufficientStock) as exc:
+            return Response({"items": [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+        cart._prefetched_objects_cache = {}  # get_object() prefetched the items before the update
+        prefetch_related_objects([cart], "items")
+        return Response(self.get_serializer(cart).data)
+
+    @swagger_auto_schema(request_body=no_body, responses={201: OrderSerializer, 400: 'Empty cart or not enough stock'})
+    @action(detail=True, methods=["post"])
+    def checkout(self, request, pk=None):
+        """Place an order for everything in the cart and empty it, in one transaction."""
+        cart = self.get_object()
+        try:
+            order = services.checkout_cart(cart)
+        except (services.EmptyCart, services.InsufficientStock) as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(OrderSerializer(order, context=self.get_serializer_context()).data, status=status.HTTP_201_CREATED)
+
 # -------------------- CART ITEM --------------------
-class CartItemViewSet(viewsets.ModelViewSet):
+class CartItemViewSet(PrefetchMixin, OwnerScopedMixin, viewsets.ModelViewSet):
     queryset = CartItem.objects.all()
     serializer_class = CartItemSerializer
     pagination_class = StandardResultsSetPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ["cart", "product"]
     permission_classes = [IsOwnerOrAdmin]
+    owner_field = "cart__user"
+    owner_may_write = True
 
 # -------------------- ORDER --------------------
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(IdempotencyMixin, ExportMixin, FastListMixin, PrefetchMixin, OwnerScopedMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetOrPagePagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
-    filterset_fields = ["user", "status", "items__product__category"]
+    filterset_class = OrderFilter
     ordering_fields = ["created_at", "total_price"]
     ordering = ["-created_at"]
     permission_classes = [IsOwnerOrAdmin]
+    export_fields = ["id", "user_id", "user__email", "status", "total_price", "created_at"]
+    idempotency_scope = "orders.create"
+
+    @swagger_auto_schema(manual_parameters=[IDEMPOTENCY_HEADER])
+    def create(self, request, *args, **kwargs):
+        return self.idempotent_response(super().create, request, *args, **kwargs)
 
 # -------------------- ORDER ITEM --------------------
-class OrderItemViewSet(viewsets.ModelViewSet):
+class OrderItemViewSet(ExportMixin, PrefetchMixin, OwnerScopedMixin, viewsets.ModelViewSet):
     queryset = OrderItem.objects.all()
     serializer_class = OrderItemSerializer
-    pagination_class = StandardResultsSetPagination
+    pagination_class = EstimatedCountPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ["order", "product"]
     permission_classes = [IsOwnerOrAdmin]
+    owner_field = "order__user"
+    export_fields = [
+        "id", "order_id", "order__user_id", "order__status", "order__created_at",
+        "product_id", "product__sku", "product__name", "quantity", "price",
+    ]
+
+    def get_export_queryset(self):
+        # Items of the orders that the same query string selects on /orders/export/
+        orders = OrderFilter(self.request.query_params, queryset=Order.objects.all(), request=self.request)
+        if not orders.is_valid():
+            raise ValidationError(orders.errors)
+        return super().get_export_queryset().filter(order__in=orders.qs.values("pk")).order_by("order_id", "pk")
 
 # -------------------- REVIEW --------------------
-class ReviewListCreateView(generics.ListCreateAPIView):
+class ReviewListCreateView(PrefetchMixin, generics.ListCreateAPIView):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic():
+            review = serializer.save(user=self.request.user)
+            services.apply_review(review.product_id, review.rating)
 
 # -------------------- PAYMENT --------------------
-class InitiatePaymentView(APIView):
+class PaymentExportView(generics.GenericAPIView):
+    """Stream payments as NDJSON or CSV; filters match the order export."""
+    queryset = Payment.objects.all()
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = PaymentFilter
+    renderer_classes = EXPORT_RENDERERS
+    permission_classes = [IsAdmin]
+    export_fields = ["id", "reference", "user_id", "user__email", "amount", "status", "transaction_id", "created_at"]
+
+    @swagger_auto_schema(responses={200: openapi.Response("Payments as NDJSON or CSV, one row per payment")})
+    def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).order_by("created_at", "pk")
+        return export_response(request, queryset, self.export_fields, "payments")
+
+class InitiatePaymentView(IdempotencyMixin, APIView):
     permission_classes = [IsAuthenticated]
+    idempotency_scope = "payments.initiate"
 
     @swagger_auto_schema(
         request_body=openapi.Schema(
@@ -219,30 +374,24 @@ class InitiatePaymentView(APIView):
             properties={'amount': openapi.Schema(type=openapi.TYPE_NUMBER)},
             required=['amount']
         ),
+        manual_parameters=[IDEMPOTENCY_HEADER],
         responses={200: openapi.Response('Checkout URL', schema=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             properties={'checkout_url': openapi.Schema(type=openapi.TYPE_STRING)}
         ))}
     )
     def post(self, request):
+        return self.idempotent_response(self.initiate, request)
+
+    def initiate(self, request):
         amount = request.data.get("amount")
         if not amount:
             return Response({"detail": "Amount is required."}, status=400)
-        payment = Payment.objects.create(user=request.user, amount=amount)
-        headers = {"Authorization": f"Bearer {os.getenv('CHAPA_SECRET_KEY')}", "Content-Type": "application/json"}
-        data = {
-            "amount": str(amount),
-            "currency": "ETB",
-            "tx_ref": str(payment.reference),
-            "callback_url": "http://localhost:8000/api/payments/verify/",
-            "return_url": "http://localhost:8000/payment/success",
-            "customization": {"title": "Bridal Dress Payment", "description": "Payment for bridal dress"}
-        }
-        r = requests.post("https://api.chapa.co/v1/transaction/initialize", json=data, headers=headers)
-        res = r.json()
-        if res.get("status") == "success":
-            return Response({"checkout_url": res["data"]["checkout_url"]})
-        return Response(res, status=400)
+        try:
+            result = services.initiate_payment(request.user, amount)
+        except gateway.GatewayError as exc:
+            return Response(*gateway_error(exc))
+        return Response(*initiation_response(result))
 
 class VerifyPaymentView(APIView):
     permission_classes = [IsAuthenticated]
@@ -255,15 +404,114 @@ class VerifyPaymentView(APIView):
         reference = request.query_params.get("tx_ref")
         if not reference:
             return Response({"detail": "Transaction reference is required."}, status=400)
-        headers = {"Authorization": f"Bearer {os.getenv('CHAPA_SECRET_KEY')}"}
-        r = requests.get(f"https://api.chapa.co/v1/transaction/verify/{reference}", headers=headers)
-        res = r.json()
-        if res.get("status") == "success" and res["data"]["status"] == "success":
-            try:
-                payment = Payment.objects.get(reference=reference)
-                payment.status = "successful"
-                payment.save()
-                return Response({"detail": "Payment verified successfully."})
-            except Payment.DoesNotExist:
-                return Response({"detail": "Payment not found."}, status=404)
-        return Response({"detail": "Payment verification failed."}, status=400)
+        try:
+            result = gateway.get_client().verify(reference)
+        except gateway.GatewayError as exc:
+            return Response(*gateway_error(exc))
+        marked = services.payment_succeeded(result) and services.mark_payment(reference, "successful")
+        return Response(*verification_response(result, marked))
+
+
+class PaymentWebhookView(APIView):
+    """
+    Chapa pushes transaction events here, so payments settle without
+    polling. The raw body must carry a valid Chapa-Signature (HMAC-SHA256
+    keyed with CHAPA_WEBHOOK_SECRET); only Pending payments are updated.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(auto_schema=None)
+    def post(self, request):
+        secret = settings.CHAPA_WEBHOOK_SECRET
+        signature = request.headers.get("Chapa-Signature") or request.headers.get("X-Chapa-Signature") or ""
+        expected = hmac.new(secret.encode(), request.body, hashlib.sha256).hexdigest()
+        if not secret or not hmac.compare_digest(signature, expected):
+            return Response({"detail": "Invalid signature."}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            event = json.loads(request.body)
+            reference = uuid.UUID(str(event.get("tx_ref")))
+        except (ValueError, AttributeError):
+            return Response({"detail": "Malformed event."}, status=status.HTTP_400_BAD_REQUEST)
+        new_status = services.PAYMENT_STATUSES.get(str(event.get("status") or "").lower())
+        if new_status is None:
+            return Response({"detail": "Event ignored."})
+        updated = services.apply_payment_statuses({reference: new_status})
+        return Response({"detail": "Payment updated." if updated else "No pending payment with this reference."})
+
+
+def gateway_error(exc):
+    """(body, status) for a gateway that could not be used."""
+    if isinstance(exc, gateway.GatewayUnavailable):
+        return {"detail": "Payment gateway unavailable, please retry shortly."}, status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"detail": str(exc)}, status.HTTP_502_BAD_GATEWAY
+
+
+def initiation_response(result):
+    if result.get("status") == "success":
+        return {"checkout_url": result["data"]["checkout_url"]}, status.HTTP_200_OK
+    return result, status.HTTP_400_BAD_REQUEST
+
+
+def verification_response(result, marked):
+    if not services.payment_succeeded(result):
+        return {"detail": "Payment verification failed."}, status.HTTP_400_BAD_REQUEST
+    if not marked:
+        return {"detail": "Payment not found."}, status.HTTP_404_NOT_FOUND
+    return {"detail": "Payment verified successfully."}, status.HTTP_200_OK
+
+
+# -------------------- PAYMENT (ASYNC) --------------------
+# Plain Django async views for ASGI deployments, with the same JSON as the
+# views above. The gateway call runs in a worker thread (thread_sensitive=
+# False), so a slow gateway holds neither the event loop nor the thread
+# that runs ORM queries. Idempotency-Key is only honoured by the sync view.
+async def authenticated_user(request):
+    """The user of a valid JWT Authorization header, or None."""
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+@csrf_exempt
+@require_POST
+async def initiate_payment_async(request):
+    user = await authenticated_user(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+    try:
+        amount = json.loads(request.body or b"{}").get("amount")
+    except (ValueError, AttributeError):
+        return JsonResponse({"detail": "Body must be a JSON object."}, status=400)
+    if not amount:
+        return JsonResponse({"detail": "Amount is required."}, status=400)
+    payment = await Payment.objects.acreate(user=user, amount=amount)
+    try:
+        result = await sync_to_async(gateway.get_client().initialize, thread_sensitive=False)(
+            services.checkout_request(payment)
+        )
+    except gateway.GatewayError as exc:
+        await sync_to_async(services.mark_payment)(payment.reference, "Failed")
+        body, code = gateway_error(exc)
+        return JsonResponse(body, status=code)
+    body, code = initiation_response(result)
+    return JsonResponse(body, status=code)
+
+
+@require_GET
+async def verify_payment_async(request):
+    if await authenticated_user(request) is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+    reference = request.GET.get("tx_ref")
+    if not reference:
+        return JsonResponse({"detail": "Transaction reference is required."}, status=400)
+    try:
+        result = await sync_to_async(gateway.get_client().verify, thread_sensitive=False)(reference)
+    except gateway.GatewayError as exc:
+        body, code = gateway_error(exc)
+        return JsonResponse(body, status=code)
+    marked = services.payment_succeeded(result) and await sync_to_async(services.mark_payment)(reference, "successful")
+    body, code = verification_response(result, marked)
+    return JsonResponse(body, status=code)
@@ -147,8 +147,17 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.AllowAny",
     ],
-    "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"]
-
+    "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
+    # orjson-backed JSON (stdlib fallback); views can still set their own renderer/parser classes
+    "DEFAULT_RENDERER_CLASSES": [
+        "bridal_api.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "bridal_api.renderers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
 AUTHENTICATION_BACKENDS = [
@@ -200,6 +209,55 @@ SWAGGER_SETTINGS = {
 # ---------------------------------------------------------------------
 CORS_ALLOW_ALL_ORIGINS = True
 
+# ---------------------------------------------------------------------
+# CACHES
+# ---------------------------------------------------------------------
+# The catalog cache defaults to a bounded in-process LocMemCache. Point
+# CATALOG_CACHE_BACKEND/CATALOG_CACHE_LOCATION at a shared backend (e.g.
+# django.core.cache.backends.redis.RedisCache) when running several workers,
+# so invalidations reach every process.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "catalog": {
+        "BACKEND": config("CATALOG_CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config("CATALOG_CACHE_LOCATION", default="catalog"),
+        "TIMEOUT": config("CATALOG_CACHE_TIMEOUT", default=300, cast=int),
+        "OPTIONS": {"MAX_ENTRIES": config("CATALOG_CACHE_MAX_ENTRIES", default=2000, cast=int)},
+    },
+}
+CATALOG_CACHE_ALIAS = "catalog"
+
+# Numbered pages count exactly up to this many rows, then use estimates (bridal_api.counts)
+PAGINATION_EXACT_COUNT_LIMIT = config("PAGINATION_EXACT_COUNT_LIMIT", default=10000, cast=int)
+COUNT_CACHE_TIMEOUT = config("COUNT_CACHE_TIMEOUT", default=600, cast=int)
+# ?search= returns at most this many (best-ranked) matches (bridal_api.search)
+SEARCH_MAX_RESULTS = config("SEARCH_MAX_RESULTS", default=1000, cast=int)
+
+# Seconds a cart line holds its stock (bridal_api.services.update_cart); swept by expire_reservations
+STOCK_RESERVATION_TTL = config("STOCK_RESERVATION_TTL", default=900, cast=int)
+
+# Seconds an Idempotency-Key response is replayed (bridal_api.idempotency)
+IDEMPOTENCY_KEY_TTL = config("IDEMPOTENCY_KEY_TTL", default=86400, cast=int)
+# Seconds before a key whose request never finished (a crashed worker) can be claimed again
+IDEMPOTENCY_KEY_LEASE = config("IDEMPOTENCY_KEY_LEASE", default=120, cast=int)
+
+# ---------------------------------------------------------------------
+# PAYMENT GATEWAY (bridal_api.gateway)
+# ---------------------------------------------------------------------
+CHAPA_SECRET_KEY = config("CHAPA_SECRET_KEY", default="")
+CHAPA_BASE_URL = config("CHAPA_BASE_URL", default="https://api.chapa.co/v1")
+CHAPA_CALLBACK_URL = config("CHAPA_CALLBACK_URL", default="http://localhost:8000/api/payments/verify/")
+CHAPA_RETURN_URL = config("CHAPA_RETURN_URL", default="http://localhost:8000/payment/success")
+CHAPA_CONNECT_TIMEOUT = config("CHAPA_CONNECT_TIMEOUT", default=3.05, cast=float)
+CHAPA_READ_TIMEOUT = config("CHAPA_READ_TIMEOUT", default=10.0, cast=float)
+CHAPA_MAX_RETRIES = config("CHAPA_MAX_RETRIES", default=2, cast=int)
+CHAPA_POOL_SIZE = config("CHAPA_POOL_SIZE", default=10, cast=int)
+CHAPA_BREAKER_THRESHOLD = config("CHAPA_BREAKER_THRESHOLD", default=5, cast=int)
+CHAPA_BREAKER_RESET = config("CHAPA_BREAKER_RESET", default=30.0, cast=float)
+CHAPA_WEBHOOK_SECRET = config("CHAPA_WEBHOOK_SECRET", default="")
+
 # ---------------------------------------------------------------------
 # CELERY
 # ---------------------------------------------------------------------
@@ -207,6 +265,11 @@ CELERY_BROKER_URL = config("CELERY_BROKER_URL", default="redis://localhost:6379/
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
+CELERY_BEAT_SCHEDULE = {
+    "reconcile-payments": {"task": "bridal_api.tasks.reconcile_payments", "schedule": 600.0},
+    "expire-reservations": {"task": "bridal_api.tasks.expire_reservations", "schedule": 60.0},
+    "purge-idempotency-keys": {"task": "bridal_api.tasks.purge_idempotency_keys", "schedule": 3600.0},
+}
 
 # ---------------------------------------------------------------------
 # DEFAULT AUTO FIELD